@@ -2,6 +2,23 @@
 Module for cars.
 """
 
+import math
+from bisect import bisect_right
+
+import numpy as np
+
+from constants import AIR_DENSITY, GRAV_ACCELERATION
+
+# Velocity thresholds (m/s) and the fraction of the power band (max - base engine power) added to the base engine power
+# within each velocity range. Velocities below the first threshold fall outside the table and use the maximum power.
+ENGINE_POWER_THRESHOLDS = (0.0, 10.0, 40.0, 70.0, 90.0)
+ENGINE_POWER_MULTIPLIERS = (1.0, 0.2, 0.5, 0.7, 0.9, 1.0)
+
+# Velocity thresholds (m/s) and the fraction of the maximum acceleration available within each velocity range. The last
+# range is bounded above by the maximum velocity of the car.
+ACCELERATION_THRESHOLDS = (0.0, 28.0, 56.0, 84.0)
+ACCELERATION_MULTIPLIERS = (0.0, 0.75, 1.0, 0.45, 0.3)
+
 
 class Car:
     """
@@ -9,6 +26,9 @@ class Car:
     Defaults values are set with respect to a modern Formula 1 car.
     """
 
+    __slots__ = ("max_velocity", "max_acceleration", "_friction", "_mass", "_drag_coefficient", "_frontal_area",
+                 "base_engine_power", "max_engine_power", "total_force", "sqrt_total_force", "drag_constant")
+
     def __init__(self, max_velocity=100.0, max_acceleration=15.5, friction=1.6, mass=740.0, drag_coefficient=1.0,
                  frontal_area=1.5, base_engine_power=100000.0, max_engine_power=800000.0):
         """
@@ -35,12 +55,131 @@ class Car:
         """
         self.max_velocity = max_velocity
         self.max_acceleration = max_acceleration
-        self.friction = friction
-        self.mass = mass
-        self.drag_coefficient = drag_coefficient
-        self.frontal_area = frontal_area
+        self._friction = friction
+        self._mass = mass
+        self._drag_coefficient = drag_coefficient
+        self._frontal_area = frontal_area
         self.base_engine_power = base_engine_power
         self.max_engine_power = max_engine_power
+        self.update_derived_constants()
+
+    @property
+    def friction(self):
+        """
+        Gets the tyre friction co-efficient of the car.
+
+        Returns:
+            friction(float): Tyre friction co-efficient of the car.
+
+        """
+        return self._friction
+
+    @friction.setter
+    def friction(self, friction):
+        """
+        Sets the tyre friction co-efficient of the car and updates the constants derived from it.
+
+        Args:
+            friction(float): Tyre friction co-efficient of the car.
+
+        """
+        self._friction = friction
+        self.update_derived_constants()
+
+    @property
+    def mass(self):
+        """
+        Gets the mass of the car.
+
+        Returns:
+            mass(float): Mass of the car in kg (including the driver).
+
+        """
+        return self._mass
+
+    @mass.setter
+    def mass(self, mass):
+        """
+        Sets the mass of the car and updates the constants derived from it.
+
+        Args:
+            mass(float): Mass of the car in kg (including the driver).
+
+        """
+        self._mass = mass
+        self.update_derived_constants()
+
+    @property
+    def drag_coefficient(self):
+        """
+        Gets the drag co-efficient of the car.
+
+        Returns:
+            drag_coefficient(float): Drag co-efficient of the car.
+
+        """
+        return self._drag_coefficient
+
+    @drag_coefficient.setter
+    def drag_coefficient(self, drag_coefficient):
+        """
+        Sets the drag co-efficient of the car and updates the constants derived from it.
+
+        Args:
+            drag_coefficient(float): Drag co-efficient of the car.
+
+        """
+        self._drag_coefficient = drag_coefficient
+        self.update_derived_constants()
+
+    @property
+    def frontal_area(self):
+        """
+        Gets the frontal area of the car.
+
+        Returns:
+            frontal_area(float): Frontal area of the car in m^2.
+
+        """
+        return self._frontal_area
+
+    @frontal_area.setter
+    def frontal_area(self, frontal_area):
+        """
+        Sets the frontal area of the car and updates the constants derived from it.
+
+        Args:
+            frontal_area(float): Frontal area of the car in m^2.
+
+        """
+        self._frontal_area = frontal_area
+        self.update_derived_constants()
+
+    def update_derived_constants(self):
+        """
+        Method to calculate the constants derived from the parameters of the car that are used in the lap time
+        calculations. Called whenever one of the parameters they depend on is changed.
+        """
+        # Total grip force of the tyres in newtons.
+        self.total_force = self._friction * self._mass * GRAV_ACCELERATION
+        self.sqrt_total_force = math.sqrt(self.total_force)
+        # Drag force per unit of squared velocity in kg/m.
+        self.drag_constant = self._drag_coefficient * 0.5 * AIR_DENSITY * self._frontal_area
+
+    @property
+    def simulation_parameters(self):
+        """
+        Gets the parameters of the car in the form used by the JIT compiled lap simulation (Refer to the lap_simulation
+        module).
+
+        Returns:
+            parameters(tuple): Tuple of the maximum velocity, maximum acceleration, mass, total force, square root of
+                the total force, drag constant, base engine power and maximum engine power of the car.
+
+        """
+        return (float(self.max_velocity), float(self.max_acceleration), float(self.mass), float(self.total_force),
+                float(self.sqrt_total_force), float(self.drag_constant), float(self.base_engine_power),
+                float(self.max_engine_power))
 
     def get_engine_power(self, velocity):
         """
@@ -53,20 +192,12 @@ class Car:
             engine_power(float): Engine power of the car at the given velocity in watts.
 
         """
-        diff = self.max_engine_power - self.base_engine_power
-        engine_power = self.base_engine_power
-
-        if velocity >= 0.0 and velocity < 10.0:
-            engine_power = engine_power + (diff * 0.2)
-        elif velocity >= 10.0 and velocity < 40.0:
-            engine_power = engine_power + (diff * 0.5)
-        elif velocity >= 40.0 and velocity < 70.0:
-            engine_power = engine_power + (diff * 0.7)
-        elif velocity >= 70.0 and velocity < 90.0:
-            engine_power = engine_power + (diff * 0.9)
-        else:
-            engine_power = self.max_engine_power
+        idx = bisect_right(ENGINE_POWER_THRESHOLDS, velocity)
+        if idx == 0 or idx == len(ENGINE_POWER_THRESHOLDS):
+            return self.max_engine_power
 
+        diff = self.max_engine_power - self.base_engine_power
+        engine_power = self.base_engine_power + (diff * ENGINE_POWER_MULTIPLIERS[idx])
         return engine_power
 
     def get_max_acceleration(self, velocity):
@@ -81,21 +212,45 @@ class Car:
             acceleration(float): The maximum velocity a car can go while travelling in a sector in m/s.
 
         """
-        acceleration = self.max_acceleration
-
-        # 0-100 kmph.
-        if velocity >= 0.0 and velocity < 28.0:
-            acceleration = acceleration * 0.75
-        # 100-200 kmph.
-        elif velocity >= 28.0 and velocity < 56.0:
-            acceleration = acceleration * 1.0
-        # 200-300 kmph.
-        elif velocity >= 56.0 and velocity < 84.0:
-            acceleration = acceleration * 0.45
-        # 300 kmph - Max Speed.
-        elif velocity >= 84.0 and velocity < self.max_velocity:
-            acceleration = acceleration * 0.3
-        else:
-            acceleration = 0.0
+        # Ranges are 0-100 kmph, 100-200 kmph, 200-300 kmph and 300 kmph - Max Speed.
+        idx = bisect_right(ACCELERATION_THRESHOLDS, velocity)
+        if idx == len(ACCELERATION_THRESHOLDS) and velocity >= self.max_velocity:
+            return 0.0
 
+        acceleration = self.max_acceleration * ACCELERATION_MULTIPLIERS[idx]
         return acceleration
+
+    def get_engine_power_batch(self, velocities):
+        """
+        Gets the engine power of a car at each of a set of velocities in a single vectorized pass.
+
+        Args:
+            velocities(np.array): Velocities of the car in m/s.
+
+        Returns:
+            engine_powers(np.array): Engine power of the car at each of the given velocities in watts.
+
+        """
+        velocities = np.asarray(velocities, dtype=np.float64)
+        idx = np.searchsorted(ENGINE_POWER_THRESHOLDS, velocities, side="right")
+        diff = self.max_engine_power - self.base_engine_power
+        engine_powers = self.base_engine_power + (diff * np.asarray(ENGINE_POWER_MULTIPLIERS)[idx])
+        out_of_table = (idx == 0) | (idx == len(ENGINE_POWER_THRESHOLDS))
+        return np.where(out_of_table, self.max_engine_power, engine_powers)
+
+    def get_max_acceleration_batch(self, velocities):
+        """
+        Gets the maximum acceleration a car can have at each of a set of velocities in a single vectorized pass.
+
+        Args:
+            velocities(np.array): Velocities that the car is running at in m/s.
+
+        Returns:
+            accelerations(np.array): The maximum acceleration of the car at each of the given velocities in m/s^2.
+
+        """
+        velocities = np.asarray(velocities, dtype=np.float64)
+        idx = np.searchsorted(ACCELERATION_THRESHOLDS, velocities, side="right")
+        accelerations = self.max_acceleration * np.asarray(ACCELERATION_MULTIPLIERS)[idx]
+        above_max_velocity = (idx == len(ACCELERATION_THRESHOLDS)) & (velocities >= self.max_velocity)
+        return np.where(above_max_velocity, 0.0, accelerations)
@@ -2,10 +2,21 @@
 Module that implements the CMA evolutionary strategy.
 """
 
+import math
+
 import numpy as np
+from scipy.linalg.blas import get_blas_funcs
 
+from cuda_kernels import CudaLapTimeEvaluator
 from evolutionary_strategy import Candidate, EvolutionaryStrategy
-from utils import clamp, en0i
+from utils import en0i
+
+# Data type of the population, mean and covariance matrices. Single precision is sufficient for the weights, which
+# only need to be accurate in the range of [0.0, 1.0], and halves the memory traffic of the matrix updates.
+MATRIX_DTYPE = np.float32
+
+# BLAS symmetric rank-k update for the matrix data type, used to build the empirical covariance matrix.
+_syrk = get_blas_funcs("syrk", dtype=MATRIX_DTYPE)
 
 
 class CMAEvolutionaryStrategy(EvolutionaryStrategy):
@@ -16,7 +27,8 @@ class CMAEvolutionaryStrategy(EvolutionaryStrategy):
     """
 
     def __init__(self, left_limit, right_limit, car, starting_velocity=0.0, weight_group_size=20, smoothing_length=9,
-                 smoothing_order=1, population_size=50, iterations=5, standard_deviation=0.3):
+                 smoothing_order=1, population_size=50, iterations=5, standard_deviation=0.3, num_workers=None,
+                 use_cuda=False, fitness_cache_size=4096, fitness_cache_decimals=4, seed=None):
         """
         Method to initialize the CMA evolutionary strategy.
 
@@ -31,24 +43,42 @@ class CMAEvolutionaryStrategy(EvolutionaryStrategy):
             population_size(int): Size of the population to be used. Defaults to 50.
             iterations(int): Number of iterations to run the algorithm for. Defaults to 5.
             standard_deviation(float): Standard deviation to use when constructing the path vector. Defaults to 0.3.
+            num_workers(int): Number of worker processes used to evaluate the fitness of the population. Defaults to
+                None, in which case the population is evaluated by the multi-threaded lap simulation kernel instead.
+            use_cuda(bool): Whether to evaluate the fitness of the population on a CUDA GPU. Falls back to evaluating
+                on the CPU if no CUDA GPU is available. Defaults to False.
+            fitness_cache_size(int): Maximum number of weight vectors to remember the fitness of, so that candidates
+                with the same weights are not simulated again. Defaults to 4096.
+            fitness_cache_decimals(int): Number of decimals the weights are rounded to when looking up the fitness
+                cache, so that candidates with nearly the same weights share a lap time. Defaults to 4.
+            seed(int): Seed of the random number generator of the strategy. Defaults to None, in which case a random
+                seed is used.
 
         """
         super(CMAEvolutionaryStrategy, self).__init__(
             left_limit=left_limit, right_limit=right_limit, car=car, starting_velocity=starting_velocity,
             weight_group_size=weight_group_size, smoothing_length=smoothing_length, smoothing_order=smoothing_order,
-            population_size=population_size, iterations=iterations, standard_deviation=standard_deviation)
+            population_size=population_size, iterations=iterations, standard_deviation=standard_deviation,
+            num_workers=num_workers, fitness_cache_size=fitness_cache_size,
+            fitness_cache_decimals=fitness_cache_decimals, seed=seed)
 
-        # Population variables.
-        self.population_matrix = np.array([[]])
-        self.means = np.array([[]])
-        self.covariance_matrix = np.array([[]])
+        # Population variables. The buffers are allocated once and filled in place every generation.
+        self.population_matrix = np.empty((self.population_size, self.candidate_length), dtype=MATRIX_DTYPE)
+        self.means = np.empty((self.candidate_length, 1), dtype=MATRIX_DTYPE)
+        self.covariance_matrix = np.empty((self.candidate_length, self.candidate_length), dtype=MATRIX_DTYPE)
+
+        # Buffers used to generate the empirical covariance matrix. The covariance buffer is in Fortran order so that
+        # BLAS can write into it in place.
+        self._centered_buf = np.empty((self.population_size, self.candidate_length), dtype=MATRIX_DTYPE)
+        self._cov_buf = np.empty((self.candidate_length, self.candidate_length), dtype=MATRIX_DTYPE, order="F")
+        self._cov_lower_indices = np.tril_indices(self.candidate_length, -1)
 
         # Path vectors
-        self.p_c = np.array([[]])
-        self.p_sigma = np.array([[]])
+        self.p_c = np.zeros((self.candidate_length, 1), dtype=MATRIX_DTYPE)
+        self.p_sigma = np.zeros((self.candidate_length, 1), dtype=MATRIX_DTYPE)
 
         # Number of parents/candidates to select.
-        self.mu = int(self.population_size / 2)
+        self.mu = self.population_size // 2
 
         # Weight of each selected element.
         self.weight = 1.0 / self.mu
@@ -74,6 +104,12 @@ class CMAEvolutionaryStrategy(EvolutionaryStrategy):
         self.eigen_values = np.array([[]])
         self.eigen_vectors = np.array([[]])
 
+        # Evaluator used to calculate the fitness of the population on the GPU.
+        self._cuda_evaluator = None
+        if use_cuda and CudaLapTimeEvaluator.is_available():
+            self._cuda_evaluator = CudaLapTimeEvaluator(self.left_limit, self.right_limit, self.car,
+                                                        self.starting_velocity)
+
     def generate_population(self):
         """
         Method to generate the population for the solution set.
@@ -83,11 +119,14 @@ class CMAEvolutionaryStrategy(EvolutionaryStrategy):
 
         """
         super(CMAEvolutionaryStrategy, self).generate_population()
-        self.population_matrix = np.array([candidate.weights for candidate in self.population])
-        self.means = np.reshape(self.population_matrix.sum(axis=0), (-1, 1)) / float(self.population_size)
+        for idx, candidate in enumerate(self.population):
+            self.population_matrix[idx] = candidate.weights
+
+        self.means[:, 0] = self.population_matrix.mean(axis=0)
         self.covariance_matrix = self.generate_empirical_covariance_matrix()
-        self.p_c = np.reshape(np.array([[0.0] * self.candidate_length]), (-1, 1))
-        self.p_sigma = np.reshape(np.array([[0.0] * self.candidate_length]), (-1, 1))
+        self.p_c.fill(0.0)
+        self.p_sigma.fill(0.0)
+        self.evaluate_population()
         self.sort_population_by_fitness()
         return self.population
 
@@ -102,17 +141,15 @@ class CMAEvolutionaryStrategy(EvolutionaryStrategy):
         offspring = []
 
         for r_idx in range(self.population_size):
-            random_vector = np.random.normal(0.0, 1.0, self.candidate_length)
+            random_vector = self.rng.standard_normal(self.candidate_length, dtype=MATRIX_DTYPE)
             random_vector = np.reshape(random_vector, (-1, 1))
 
             new_weights = self.means + self.standard_deviation * (self.eigen_vectors.dot(
                 self.eigen_values.dot(random_vector)))
-            new_weights = new_weights.transpose()[0]
-            new_weights = [clamp(w, 0.0, 1.0) for w in new_weights]
+            new_weights = np.clip(new_weights.transpose()[0], 0.0, 1.0, out=self.population_matrix[r_idx])
 
             new_candidate = Candidate(list(new_weights))
             offspring.append(new_candidate)
-            self.population_matrix[r_idx] = new_weights
 
         self.population = offspring
         return offspring
@@ -125,62 +162,82 @@ class CMAEvolutionaryStrategy(EvolutionaryStrategy):
             best_candidate(Candidate): Candidate with the best fitness (least lap time) in the final population.
 
         """
-        self.generate_population()
+        # The pool is only used when a number of workers is given and the population is not evaluated on the GPU.
+        with self.pool_context(bool(self.num_workers) and not self._cuda_evaluator):
+            self.generate_population()
+
+            for generation in range(self.iterations):
+                average_fitness = self.get_average_fitness()
+                print("Generation {}".format(generation))
+                print("Average fitness: {}".format(average_fitness))
+                print("Standard deviation: {}".format(self.standard_deviation))
+
+                # Getting the Eigen decomposition of the covariance matrix. The decomposition is done in double
+                # precision as it is sensitive to rounding errors in the covariance matrix.
+                self.eigen_values, self.eigen_vectors = np.linalg.eigh(self.covariance_matrix.astype(np.float64))
+                self.eigen_values = np.sqrt(np.diag(self.eigen_values)).astype(MATRIX_DTYPE)
+                self.eigen_vectors = self.eigen_vectors.astype(MATRIX_DTYPE)
+
+                # Calculating the new population.
+                self.generate_offspring()
+                self.evaluate_population()
+                self.sort_population_by_fitness()
+
+                # Calculating the new means for the mu best individuals.
+                new_means = np.zeros((self.candidate_length, 1), dtype=MATRIX_DTYPE)
+                for idx in range(self.mu):
+                    weights = np.reshape(self.population_matrix[idx], (-1, 1))
+                    new_means = new_means + (self.weight * weights)
+
+                # Constructing the evolution path.
+                self.p_c = (1 - self.c_c) * self.p_c + math.sqrt(self.c_c * (2.0 - self.c_c) * self.mu_eff) * \
+                    (new_means - self.means) / self.standard_deviation
+
+                # Rank update of the covariance matrix.
+                mu_update = np.zeros((self.candidate_length, self.candidate_length), dtype=MATRIX_DTYPE)
+                for idx in range(self.mu):
+                    rhs = (np.reshape(self.population_matrix[idx], (-1, 1)) - self.means) / self.standard_deviation
+                    mu_update = mu_update + (self.weight * (rhs.dot(rhs.transpose())))
+
+                self.covariance_matrix = (1 - self.c_cov) * self.covariance_matrix + self.c_cov / self.mu_cov * \
+                    (self.p_c.dot(self.p_c.transpose())) + self.c_cov * (1 - 1 / self.mu_cov) * mu_update
+
+                # Updating the step size.
+                decomposed_cov = self.eigen_vectors.dot(np.linalg.inv(self.eigen_values).dot(
+                    self.eigen_vectors.transpose()))
+                self.p_sigma = (1 - self.c_sigma) * self.p_sigma + math.sqrt(self.c_sigma * (2 - self.c_sigma) * \
+                    self.mu_eff) * decomposed_cov * (new_means - self.means) / self.standard_deviation
+                p_sigma_sum_squares = np.sum(np.square(self.p_sigma))
+                self.standard_deviation = self.standard_deviation * math.exp(self.c_sigma / self.d_sigma * \
+                    (math.sqrt(p_sigma_sum_squares) / en0i(self.candidate_length) - 1))
+                self.means = new_means
+
+                print("")
 
-        for generation in range(self.iterations):
-            average_fitness = self.get_average_fitness()
-            print("Generation {}".format(generation))
-            print("Average fitness: {}".format(average_fitness))
-            print("Standard deviation: {}".format(self.standard_deviation))
-
-            # Getting the Eigen decomposition of the covariance matrix.
-            self.eigen_values, self.eigen_vectors = np.linalg.eigh(self.covariance_matrix)
-            self.eigen_values = np.sqrt(np.diag(self.eigen_values))
-
-            # Calculating the new population.
-            self.generate_offspring()
-            self.sort_population_by_fitness()
-
-            # Calculating the new means for the mu best individuals.
-            new_means = np.array([[0.0] * self.candidate_length]).transpose()
-            for idx in range(self.mu):
-                weights = np.reshape(self.population_matrix[idx], (-1, 1))
-                new_means = new_means + (self.weight * weights)
-
-            # Constructing the evolution path.
-            self.p_c = (1 - self.c_c) * self.p_c + np.sqrt(self.c_c * (2.0 - self.c_c) * self.mu_eff) * \
-                (new_means - self.means) / self.standard_deviation
+        print("Completed running the CMA-ES algorithm.")
+        # Select the candidate with the least lap time.
+        best_candidate = min(self.population, key=lambda candidate: candidate.lap_time)
 
-            # Rank update of the covariance matrix.
-            mu_update = np.array([[0.0] * self.candidate_length] * self.candidate_length)
-            for idx in range(self.mu):
-                rhs = (np.reshape(self.population_matrix[idx], (-1, 1)) - self.means) / self.standard_deviation
-                mu_update = mu_update + (self.weight * (rhs.dot(rhs.transpose())))
+        print("Best fitness after running the algorithm: {}".format(best_candidate.fitness))
+        return best_candidate
 
-            self.covariance_matrix = (1 - self.c_cov) * self.covariance_matrix + self.c_cov / self.mu_cov * \
-                (self.p_c.dot(self.p_c.transpose())) + self.c_cov * (1 - 1 / self.mu_cov) * mu_update
+    def calculate_lap_times(self, weights):
+        """
+        Method to calculate the lap times of the racing lines generated from the weights of a batch of candidates. The
+        candidates are evaluated on the GPU if enabled, or on the CPU otherwise (Refer to
+        EvolutionaryStrategy.calculate_lap_times).
 
-            # Updating the step size.
-            decomposed_cov = self.eigen_vectors.dot(np.linalg.inv(self.eigen_values).dot(
-                self.eigen_vectors.transpose()))
-            self.p_sigma = (1 - self.c_sigma) * self.p_sigma + np.sqrt(self.c_sigma * (2 - self.c_sigma) * \
-                self.mu_eff) * decomposed_cov * (new_means - self.means) / self.standard_deviation
-            p_sigma_sum_squares = np.sum(np.square(self.p_sigma))
-            self.standard_deviation = self.standard_deviation * np.exp(self.c_sigma / self.d_sigma * \
-                (np.sqrt(p_sigma_sum_squares) / en0i(self.candidate_length) - 1))
-            self.means = new_means
+        Args:
+            weights(np.array): Weights of each candidate, with one row per candidate.
 
-            print("")
+        Returns:
+            lap_times(list): Lap time of each candidate in seconds.
 
-        print("Completed running the CMA-ES algorithm.")
-        best_candidate = self.population[0]
-        for idx in range(1, self.population_size):
-            # Select the candidate with the least lap time.
-            if (self.population[idx].fitness < best_candidate.fitness):
-                best_candidate = self.population[idx]
+        """
+        if self._cuda_evaluator:
+            return self._cuda_evaluator.evaluate(weights)
 
-        print("Best fitness after running the algorithm: {}".format(best_candidate.fitness))
-        return best_candidate
+        return super(CMAEvolutionaryStrategy, self).calculate_lap_times(weights)
 
     def get_average_fitness(self):
         """
@@ -220,16 +277,14 @@ class CMAEvolutionaryStrategy(EvolutionaryStrategy):
             covariance_matrix(np.array): Covariance matrix for the population.
 
         """
-        cols = len(self.population_matrix[0])
-        covariance_matrix = np.array([[0.0] * cols] * cols)
-        column_sums = self.population_matrix.sum(axis=0)
-        column_sums = np.reshape(column_sums, (-1, 1)).transpose()
-
-        for row in self.population_matrix:
-            mat_row = np.reshape(row, (-1, 1)).transpose()
-            bracket = mat_row - (1.0 / self.population_size) * column_sums
-            bracket = bracket.transpose()
-            covariance_matrix = covariance_matrix + (bracket.dot(bracket.transpose()))
-
-        self.covariance_matrix = 1.0 / (self.population_size - 1) * covariance_matrix
+        # Centering the population on the column means lets the sum of outer products be computed as a single matrix
+        # product instead of accumulating one outer product per candidate.
+        mean = self.population_matrix.mean(axis=0, keepdims=True)
+        np.subtract(self.population_matrix, mean, out=self._centered_buf)
+
+        # The transpose of the row major centered matrix is already in Fortran order, so BLAS reads it without a copy.
+        # The rank-k update only fills the upper triangle, which is then mirrored to the lower triangle.
+        _syrk(1.0 / (self.population_size - 1), self._centered_buf.T, beta=0.0, c=self._cov_buf, overwrite_c=1)
+        self._cov_buf[self._cov_lower_indices] = self._cov_buf.T[self._cov_lower_indices]
+        self.covariance_matrix = self._cov_buf
         return self.covariance_matrix
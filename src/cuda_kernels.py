@@ -0,0 +1,303 @@
+"""
+Module implementing CUDA kernels to evaluate the lap times of a population of candidates on the GPU.
+"""
+
+import math
+
+import numpy as np
+from numba import cuda
+
+from car import ACCELERATION_MULTIPLIERS, ACCELERATION_THRESHOLDS, ENGINE_POWER_MULTIPLIERS, ENGINE_POWER_THRESHOLDS
+from lap_simulation import COLINEAR_EPSILON
+
+# Number of threads in a block when launching the population evaluation kernel.
+THREADS_PER_BLOCK = 256
+
+
+@cuda.jit(device=True)
+def _get_engine_power(velocity, base_engine_power, max_engine_power):
+    """
+    Device function to get the engine power of a car at a particular velocity. Mirrors Car.get_engine_power.
+    """
+    idx = 0
+    while idx < len(ENGINE_POWER_THRESHOLDS) and velocity >= ENGINE_POWER_THRESHOLDS[idx]:
+        idx = idx + 1
+
+    if idx == 0 or idx == len(ENGINE_POWER_THRESHOLDS):
+        return max_engine_power
+
+    return base_engine_power + ((max_engine_power - base_engine_power) * ENGINE_POWER_MULTIPLIERS[idx])
+
+
+@cuda.jit(device=True)
+def _get_max_acceleration(velocity, max_velocity, max_acceleration):
+    """
+    Device function to get the maximum acceleration a car can have at a given velocity. Mirrors
+    Car.get_max_acceleration.
+    """
+    idx = 0
+    while idx < len(ACCELERATION_THRESHOLDS) and velocity >= ACCELERATION_THRESHOLDS[idx]:
+        idx = idx + 1
+
+    if idx == len(ACCELERATION_THRESHOLDS) and velocity >= max_velocity:
+        return 0.0
+
+    return max_acceleration * ACCELERATION_MULTIPLIERS[idx]
+
+
+@cuda.jit(device=True)
+def _get_vertex(weights, left, offsets, pos, vertex_idx):
+    """
+    Device function to get the coordinates of a vertex of the racing line generated from a candidate's weights.
+    Mirrors RacingLine.generate_from_weights, including the rounding of the vertices to single precision (Refer to
+    racing_line.VERTEX_DTYPE). The coordinates are returned in double precision for the geometry calculations.
+    """
+    weight = min(max(weights[pos, vertex_idx], 0.0), 1.0)
+    return (np.float64(np.float32(left[vertex_idx, 0] + (offsets[vertex_idx, 0] * weight))),
+            np.float64(np.float32(left[vertex_idx, 1] + (offsets[vertex_idx, 1] * weight))),
+            np.float64(np.float32(left[vertex_idx, 2] + (offsets[vertex_idx, 2] * weight))))
+
+
+@cuda.jit(device=True)
+def _get_squared_distance(start, end):
+    """
+    Device function to get the squared distance between two vertices.
+    """
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    dz = end[2] - start[2]
+    return (dx * dx) + (dy * dy) + (dz * dz)
+
+
+@cuda.jit(device=True)
+def _get_squared_cross_product(start, mid, end):
+    """
+    Device function to get the squared magnitude of the cross product of the two segments of a sector. Mirrors
+    lap_simulation.get_squared_cross_product.
+    """
+    ux, uy, uz = mid[0] - start[0], mid[1] - start[1], mid[2] - start[2]
+    vx, vy, vz = end[0] - mid[0], end[1] - mid[1], end[2] - mid[2]
+    cx = (uy * vz) - (uz * vy)
+    cy = (uz * vx) - (ux * vz)
+    cz = (ux * vy) - (uy * vx)
+    return (cx * cx) + (cy * cy) + (cz * cz)
+
+
+@cuda.jit(device=True)
+def _get_sector_radius(a_squared, b_squared, c_squared, squared_cross_product):
+    """
+    Device function to get the radius of a sector from the squared distances between its vertices. Mirrors
+    lap_simulation.get_sector_geometry.
+    """
+    # Colinear sectors are straights, so the angle calculation is skipped for them. This includes sectors with two
+    # vertices at the same position, for which the cross product and one of the distances are zero.
+    if squared_cross_product <= COLINEAR_EPSILON * b_squared * c_squared:
+        return math.inf
+
+    cos_angle = (c_squared + b_squared - a_squared) / (2 * math.sqrt(b_squared) * math.sqrt(c_squared))
+    cos_angle = min(max(cos_angle, -1.0), 1.0)
+    if cos_angle == 1.0 or cos_angle == -1.0:
+        return math.inf
+
+    return math.sqrt(a_squared) / (2 * math.sqrt(1.0 - (cos_angle * cos_angle)))
+
+
+@cuda.jit(device=True)
+def _get_sector_max_velocity(mass_over_radius, max_velocity, sqrt_total_force, drag_constant):
+    """
+    Device function to get the maximum velocity a car can take around a sector. Mirrors
+    LapTimeCalculator.get_sector_max_velocity.
+    """
+    denom = (mass_over_radius * mass_over_radius) + (drag_constant * drag_constant)
+    denom = math.sqrt(math.sqrt(denom))
+    velocity = sqrt_total_force / denom
+    return min(velocity, max_velocity)
+
+
+@cuda.jit(device=True)
+def _get_sector_entry_velocity(mass_over_radius, length, max_velocity, mass, total_force, drag_constant,
+                               exit_velocity):
+    """
+    Device function to get the entry velocity of a car through a sector from an exit velocity through braking.
+    Mirrors LapTimeCalculator.get_sector_entry_velocity.
+    """
+    squared_velocity = exit_velocity * exit_velocity
+    centripetal_force = mass_over_radius * squared_velocity
+    braking_force = math.sqrt((total_force * total_force) - (centripetal_force * centripetal_force))
+    drag_force = drag_constant * squared_velocity
+    decelerative_force = braking_force + drag_force
+    delta_velocity = 2 * length * decelerative_force / mass
+    entry_velocity = math.sqrt(squared_velocity + delta_velocity)
+    return min(entry_velocity, max_velocity)
+
+
+@cuda.jit(device=True)
+def _get_sector_exit_velocity(length, max_velocity, max_acceleration, mass, drag_constant, base_engine_power,
+                              max_engine_power, entry_velocity):
+    """
+    Device function to get the exit velocity of a car through a sector from an entry velocity through acceleration.
+    Mirrors LapTimeCalculator.get_sector_exit_velocity.
+    """
+    squared_velocity = entry_velocity * entry_velocity
+    drag_force = drag_constant * squared_velocity
+    power = _get_engine_power(entry_velocity, base_engine_power, max_engine_power)
+    p_velocity = 1.0 if entry_velocity == 0.0 else entry_velocity
+    acceleration = ((power / p_velocity) - drag_force) / mass
+    limit = _get_max_acceleration(entry_velocity, max_velocity, max_acceleration)
+    acceleration = min(acceleration, limit)
+    exit_velocity = math.sqrt(squared_velocity + (2 * acceleration * length))
+    return min(exit_velocity, max_velocity)
+
+
+@cuda.jit
+def evaluate_population_kernel(weights, left, offsets, max_velocity, max_acceleration, mass, total_force,
+                               sqrt_total_force, drag_constant, base_engine_power, max_engine_power, starting_velocity,
+                               mass_over_radii, lengths, entry_velocities, exit_velocities, lap_times):
+    """
+    Kernel to calculate the lap time of each candidate in a population, with one thread per candidate. Each thread
+    generates the sectors of its candidate's racing line and runs the same passes as
+    LapTimeCalculator.calculate_lap_time.
+
+    Args:
+        weights(DeviceNDArray): Weights of each candidate, with one row per candidate.
+        left(DeviceNDArray): Vertices of the left side track limit, with one row per vertex.
+        offsets(DeviceNDArray): Offset from each vertex of the left side track limit to the same vertex of the right
+            side track limit, with one row per vertex.
+        max_velocity(float): Maximum velocity of the car in m/s.
+        max_acceleration(float): Maximum acceleration of the car in m/s^2.
+        mass(float): Mass of the car in kg.
+        total_force(float): Total grip force of the tyres of the car in newtons.
+        sqrt_total_force(float): Square root of the total grip force of the tyres of the car.
+        drag_constant(float): Drag force of the car per unit of squared velocity in kg/m.
+        base_engine_power(float): Base engine power of the car in watts.
+        max_engine_power(float): Maximum engine power of the car in watts.
+        starting_velocity(float): Velocity at which the car starts on the racing line in m/s.
+        mass_over_radii(DeviceNDArray): Scratch buffer for the mass of the car divided by the radius of each sector,
+            with one row per candidate.
+        lengths(DeviceNDArray): Scratch buffer for the length of each sector, with one row per candidate.
+        entry_velocities(DeviceNDArray): Scratch buffer for the entry velocities, with one row per candidate.
+        exit_velocities(DeviceNDArray): Scratch buffer for the exit velocities, with one row per candidate.
+        lap_times(DeviceNDArray): Output buffer for the lap time of each candidate in seconds.
+
+    """
+    pos = cuda.grid(1)
+    if pos >= weights.shape[0]:
+        return
+
+    num_vertices = weights.shape[1]
+    num_sectors = mass_over_radii.shape[1]
+    half = num_vertices // 2
+
+    # Generating the sectors in the same way as RacingLine.sectors. The vertices of each sector are generated once and
+    # shared by its distances and cross product.
+    for sector_idx in range(num_sectors):
+        idx = sector_idx % half if sector_idx >= half else sector_idx
+        start_idx = idx * 2
+        start = _get_vertex(weights, left, offsets, pos, start_idx)
+        mid = _get_vertex(weights, left, offsets, pos, (start_idx + 1) % num_vertices)
+        end = _get_vertex(weights, left, offsets, pos, (start_idx + 2) % num_vertices)
+        a_squared = _get_squared_distance(start, end)
+        b_squared = _get_squared_distance(mid, end)
+        c_squared = _get_squared_distance(start, mid)
+        radius = _get_sector_radius(a_squared, b_squared, c_squared, _get_squared_cross_product(start, mid, end))
+        mass_over_radii[pos, sector_idx] = mass / radius
+        lengths[pos, sector_idx] = math.sqrt(c_squared) + math.sqrt(b_squared)
+
+    # First pass to find the exit velocities of each sector (to apply acceleration/deceleration).
+    entry_velocity = starting_velocity
+    for idx in range(num_sectors):
+        exit_velocity = _get_sector_exit_velocity(lengths[pos, idx], max_velocity, max_acceleration, mass,
+                                                  drag_constant, base_engine_power, max_engine_power, entry_velocity)
+        max_sector_velocity = _get_sector_max_velocity(mass_over_radii[pos, idx], max_velocity, sqrt_total_force,
+                                                       drag_constant)
+        entry_velocity = min(entry_velocity, max_sector_velocity)
+        exit_velocity = min(exit_velocity, max_sector_velocity)
+        entry_velocities[pos, idx] = entry_velocity
+        exit_velocities[pos, idx] = exit_velocity
+        entry_velocity = exit_velocity
+
+    # Second pass to adjust the entry velocities of each sector based on the exit velocities (to apply braking). A
+    # sector is not changed again once the pass has moved on from it, so its time is added to the lap time right away.
+    lap_time = 0.0
+    last_sector_idx = 0
+    for current_sector_idx in range(num_sectors - 1, -1, -1):
+        next_entry_velocity = entry_velocities[pos, last_sector_idx]
+        if exit_velocities[pos, current_sector_idx] > next_entry_velocity:
+            max_entry_velocity = _get_sector_entry_velocity(
+                mass_over_radii[pos, current_sector_idx], lengths[pos, current_sector_idx], max_velocity, mass,
+                total_force, drag_constant, next_entry_velocity)
+            entry_velocities[pos, current_sector_idx] = min(entry_velocities[pos, current_sector_idx],
+                                                            max_entry_velocity)
+            exit_velocities[pos, current_sector_idx] = next_entry_velocity
+
+        sector_velocity = entry_velocities[pos, current_sector_idx] + exit_velocities[pos, current_sector_idx]
+        lap_time = lap_time + (2 * lengths[pos, current_sector_idx] / sector_velocity)
+        last_sector_idx = current_sector_idx
+
+    lap_times[pos] = lap_time
+
+
+class CudaLapTimeEvaluator:
+    """
+    Class to calculate the lap times of a population of candidates on the GPU.
+    The left track limit and the offsets from it to the right track limit are copied to the GPU once, after which only
+    the weights of the candidates are copied every generation.
+    """
+
+    def __init__(self, left_limit, right_limit, car, starting_velocity=0.0):
+        """
+        Method to initialize the CUDA lap time evaluator.
+
+        Args:
+            left_limit(RacingLine): Left side track limit.
+            right_limit(RacingLine): Right side track limit.
+            car(Car): Car to evaluate the racing lines for.
+            starting_velocity(float): Starting velocity of the car in m/s. Defaults to 0.0 m/s.
+
+        """
+        self.left_vertices = cuda.to_device(left_limit.vertex_array)
+        self.limit_offsets = cuda.to_device(right_limit.vertex_array - left_limit.vertex_array)
+        self.num_vertices = len(left_limit.vertices)
+        self.num_sectors = (self.num_vertices + 1) // 2
+        self.car = car
+        self.starting_velocity = starting_velocity
+
+    @staticmethod
+    def is_available():
+        """
+        Method to check whether a CUDA capable GPU is available to evaluate lap times on.
+
+        Returns:
+            available(bool): True if a CUDA GPU is available, False otherwise.
+
+        """
+        return cuda.is_available()
+
+    def evaluate(self, weights):
+        """
+        Method to calculate the lap times of the racing lines generated from the weights of a set of candidates.
+
+        Args:
+            weights(np.array): Weights of each candidate, with one row per candidate.
+
+        Returns:
+            lap_times(np.array): Lap time of each candidate in seconds.
+
+        """
+        weights = np.ascontiguousarray(weights, dtype=np.float64)
+        num_candidates = len(weights)
+        d_weights = cuda.to_device(weights)
+        shape = (num_candidates, self.num_sectors)
+        d_mass_over_radii = cuda.device_array(shape, dtype=np.float64)
+        d_lengths = cuda.device_array(shape, dtype=np.float64)
+        d_entry_velocities = cuda.device_array(shape, dtype=np.float64)
+        d_exit_velocities = cuda.device_array(shape, dtype=np.float64)
+        d_lap_times = cuda.device_array(num_candidates, dtype=np.float64)
+
+        blocks = (num_candidates + THREADS_PER_BLOCK - 1) // THREADS_PER_BLOCK
+        evaluate_population_kernel[blocks, THREADS_PER_BLOCK](
+            d_weights, self.left_vertices, self.limit_offsets, *self.car.simulation_parameters,
+            float(self.starting_velocity), d_mass_over_radii, d_lengths, d_entry_velocities, d_exit_velocities,
+            d_lap_times)
+
+        return d_lap_times.copy_to_host()
@@ -2,14 +2,66 @@
 Module that implements the evolutionary strategy.
 """
 
-import random
+import contextlib
+import math
+import multiprocessing
+from collections import OrderedDict
 
 import numpy as np
-from scipy.signal import savgol_filter
+from scipy.ndimage import convolve1d
+from scipy.signal import savgol_coeffs
 
 from lap_time_calculator import LapTimeCalculator
 from racing_line import RacingLine
-from utils import clamp
+
+# Data type of the weights of the population. Single precision is sufficient for the weights, which only need to be
+# accurate in the range of [0.0, 1.0], and halves the memory traffic of generating and mutating the population.
+WEIGHT_DTYPE = np.float32
+
+# Offset added to the selection weight of every candidate in seconds, so that the slowest candidate can still be
+# selected.
+SELECTION_EPSILON = 1e-6
+
+# Start method of the worker processes of the strategy's process pool. The workers are spawned instead of forked, as
+# forking a process after the multi-threaded lap simulation kernel has started its threads can deadlock the process.
+POOL_START_METHOD = "spawn"
+
+# State shared by the candidate evaluation functions in the worker processes of the strategy's process pool.
+_worker_state = {}
+
+
+def _initialize_worker(left_limit, right_limit, car, starting_velocity):
+    """
+    Method to initialize a worker process used to evaluate the fitness of candidates.
+
+    Args:
+        left_limit(RacingLine): Left side track limit.
+        right_limit(RacingLine): Right side track limit.
+        car(Car): Car to evaluate the racing line for.
+        starting_velocity(float): Starting velocity of the car in m/s.
+
+    """
+    _worker_state["generate_racing_line"] = RacingLine.build_factory(left_limit, right_limit)
+    _worker_state["car"] = car
+    _worker_state["starting_velocity"] = starting_velocity
+    _worker_state["lap_time_calculator"] = LapTimeCalculator(car)
+
+
+def _evaluate_weights(weights):
+    """
+    Method to calculate the lap time of the racing line generated from a candidate's weights in a worker process.
+
+    Args:
+        weights(list): List of weights of the candidate.
+
+    Returns:
+        lap_time(float): Lap time of the car in seconds.
+
+    """
+    line = _worker_state["generate_racing_line"](weights)
+    return _worker_state["lap_time_calculator"].calculate_lap_time(line, _worker_state["car"],
+                                                                   _worker_state["starting_velocity"],
+                                                                   draw_graph=False)
 
 
 class Candidate:
@@ -23,6 +75,8 @@ class Candidate:
     at the center.
     """
 
+    __slots__ = ("weights", "lap_time")
+
     def __init__(self, weights=None):
         """
         Method to initialize the candidate.
@@ -31,7 +85,7 @@ class Candidate:
             weights(list): List of weights, each of which is in the range [0, 1]. Defaults to None.
 
         """
-        self.weights = weights if weights else []
+        self.weights = weights if weights is not None else []
         self.lap_time = None
 
     @property
@@ -54,7 +108,8 @@ class EvolutionaryStrategy:
 
     def __init__(self, left_limit, right_limit, car, starting_velocity=0.0, weight_group_size=20, smoothing_length=9,
                  smoothing_order=1, population_size=50, iterations=5, num_offspring=50, mutation_factor=0.5,
-                 standard_deviation=0.3):
+                 standard_deviation=0.3, num_workers=None, fitness_cache_size=4096, fitness_cache_decimals=4,
+                 seed=None):
         """
         Method to initialize the evolutionary strategy.
 
@@ -71,6 +126,14 @@ class EvolutionaryStrategy:
             num_offspring(int): Number of offspring to generate each generation. Defaults to 50.
             mutation_factor(float): Factor by which the offspring are to be mutated. Defaults to 0.5.
             standard_deviation(float): Standard deviation to use when constructing the path vector. Defaults to 0.3.
+            num_workers(int): Number of worker processes used to evaluate the fitness of the population. Defaults to
+                None, in which case the population is evaluated in the main process.
+            fitness_cache_size(int): Maximum number of weight vectors to remember the fitness of, so that candidates
+                with the same weights are not simulated again. Defaults to 4096.
+            fitness_cache_decimals(int): Number of decimals the weights are rounded to when looking up the fitness
+                cache, so that candidates with nearly the same weights share a lap time. Defaults to 4.
+            seed(int): Seed of the random number generator of the strategy. Defaults to None, in which case a random
+                seed is used.
 
         """
         self.right_limit = right_limit
@@ -83,10 +146,39 @@ class EvolutionaryStrategy:
         self.population_size = population_size
         self.iterations = iterations
         self.population = []
+        # Weights of the candidates in the population, with one row per candidate in the same order as the population.
+        self.population_weights = np.empty((0, len(self.left_limit.vertices)), dtype=WEIGHT_DTYPE)
         self.num_offspring = num_offspring
         self.mutation_factor = mutation_factor
         self.standard_deviation = standard_deviation
         self.candidate_length = len(self.left_limit.vertices)
+        self.rng = np.random.default_rng(seed)
+        self.lap_time_calculator = LapTimeCalculator(car)
+        self.generate_racing_line = RacingLine.build_factory(left_limit, right_limit)
+        # Offset from the left to the right track limit at each vertex, used to evaluate batches of candidates.
+        self.limit_offsets = right_limit.vertex_array - left_limit.vertex_array
+        self.fitness_cache_size = fitness_cache_size
+        self.fitness_cache_decimals = fitness_cache_decimals
+        self.fitness_cache_hits = 0
+        self.fitness_cache_misses = 0
+        self._fitness_cache = OrderedDict()
+
+        # Savitzky-Golay coefficients used to smooth the weights, which only depend on the smoothing parameters.
+        self._sg_coeffs = None
+        self._sg_left_edge_coeffs = None
+        self._sg_right_edge_coeffs = None
+        if smoothing_length > 0:
+            half_length = smoothing_length // 2
+            self._sg_coeffs = savgol_coeffs(smoothing_length, smoothing_order)
+            self._sg_left_edge_coeffs = np.array([
+                savgol_coeffs(smoothing_length, smoothing_order, pos=pos, use="dot") for pos in range(half_length)])
+            self._sg_right_edge_coeffs = np.array([
+                savgol_coeffs(smoothing_length, smoothing_order, pos=pos, use="dot")
+                for pos in range(smoothing_length - half_length, smoothing_length)])
+
+        # Process pool used to evaluate the fitness of the population. Only available while the strategy is running.
+        self.num_workers = num_workers
+        self._pool = None
 
     def generate_population(self):
         """
@@ -96,22 +188,29 @@ class EvolutionaryStrategy:
             population(list): List of Candidates in the population.
 
         """
-        population = []
-        for _ in range(self.population_size):
-            # Creating weights in groups.
-            weights = []
-            for idx in range(0, self.candidate_length, self.weight_group_size):
-                group_size = self.weight_group_size if idx + self.weight_group_size - 1 < self.candidate_length else \
-                    self.candidate_length - idx
-                weights.extend([random.uniform(0.0, 1.0)] * group_size)
-
-            # Smoothening weights using the Savitzsky-Golay filter (cubic).
-            if self.smoothing_length > 0:
-                weights = list(savgol_filter(weights, self.smoothing_length, self.smoothing_order))
-
-            population.append(Candidate(weights))
-
+        # Creating weights in groups, with one uniformly distributed value at the center of every weight group of every
+        # candidate, at (group * weight_group_size + weight_group_size / 2). The weights in between are linearly
+        # interpolated from the values of the neighbouring groups, and the weights before the first center or after the
+        # last one take the value of that group. This is the same as np.interp over the group centers for each
+        # candidate, and gives smooth weights without a filter pass.
+        num_groups = math.ceil(self.candidate_length / self.weight_group_size)
+        group_weights = self.rng.random((self.population_size, num_groups), dtype=WEIGHT_DTYPE)
+        positions = (np.arange(self.candidate_length) - (self.weight_group_size / 2)) / self.weight_group_size
+        positions = np.clip(positions, 0.0, num_groups - 1)
+        lower_groups = positions.astype(np.intp)
+        upper_groups = np.minimum(lower_groups + 1, num_groups - 1)
+        fractions = (positions - lower_groups).astype(WEIGHT_DTYPE)
+        weights = group_weights[:, lower_groups] * (1.0 - fractions) + group_weights[:, upper_groups] * fractions
+
+        # Smoothening weights using the Savitzsky-Golay filter. The interpolated weights are already smooth within a
+        # weight group, so the filter is only worth applying if its window is longer than a group.
+        if self.smoothing_length > self.weight_group_size:
+            weights = self.smooth_weights(weights)
+
+        # The candidates share their rows of the weights of the population instead of copying them.
+        population = [Candidate(candidate_weights) for candidate_weights in weights]
         self.population = population
+        self.population_weights = weights
         return population
 
     def generate_offspring(self):
@@ -122,36 +221,46 @@ class EvolutionaryStrategy:
             offspring(list): List of offspring Candidates that were generated by mutating the parents.
 
         """
-        offspring = []
-
-        for _ in range(self.num_offspring):
-            idx = np.random.randint(0, self.population_size)
-            parent = self.population[idx]
-            path_vector = []
+        # Generating the offspring of all the randomly picked parents at once. The path vector has a normally
+        # distributed value for every weight group, which is repeated over the weights in the group.
+        parent_indices = self.rng.integers(0, self.population_size, size=self.num_offspring)
+        parent_weights = self.population_weights[parent_indices]
+        num_groups = math.ceil(self.candidate_length / self.weight_group_size)
+        path_vectors = self.rng.standard_normal((self.num_offspring, num_groups), dtype=WEIGHT_DTYPE)
+        path_vectors *= self.standard_deviation
+        path_vectors = np.repeat(path_vectors, self.weight_group_size, axis=1)[:, :self.candidate_length]
+        offspring_weights = np.clip(parent_weights + (path_vectors * self.mutation_factor), 0.0, 1.0)
+
+        # Smoothening weights using the Savitzsky-Golay filter (cubic).
+        if self.smoothing_length > 0:
+            offspring_weights = self.smooth_weights(offspring_weights)
+
+        offspring = [Candidate(weights) for weights in offspring_weights]
+        self.population_weights = np.concatenate((self.population_weights, offspring_weights))
+        self.population.extend(offspring)
+        return offspring
 
-            # Generating the path vector from normally distributed values for every weight group.
-            for w_idx in range(0, len(parent.weights), self.weight_group_size):
-                group_size = self.weight_group_size if w_idx + self.weight_group_size - 1 < len(parent.weights) else \
-                    len(parent.weights) - idx
-                delta_weights = list(np.random.normal(0.0, self.standard_deviation, 1)) * group_size
-                path_vector.extend(delta_weights)
+    def smooth_weights(self, weights):
+        """
+        Method to smooth the weights of a batch of candidates using the Savitzky-Golay filter. Gives the same result as
+        scipy.signal.savgol_filter in its default "interp" mode, but with coefficients that are computed once.
 
-            mutated_vector = [weight * self.mutation_factor for weight in path_vector]
-            offspring_weights = []
+        Args:
+            weights(np.array): Weights of each candidate, with one row per candidate.
 
-            for w_idx in range(len(parent.weights)):
-                offspring_weight = clamp(parent.weights[w_idx] + mutated_vector[w_idx], 0.0, 1.0)
-                offspring_weights.append(offspring_weight)
+        Returns:
+            weights(np.array): Smoothed weights of each candidate, with one row per candidate.
 
-            # Smoothening weights using the Savitzsky-Golay filter (cubic).
-            if self.smoothing_length > 0:
-                offspring_weights = list(savgol_filter(offspring_weights, self.smoothing_length, self.smoothing_order))
+        """
+        smoothed = convolve1d(weights, self._sg_coeffs, axis=1, mode="constant")
 
-            new_candidate = Candidate(offspring_weights)
-            offspring.append(new_candidate)
+        # Near the ends, the filter evaluates the polynomial fitted to the first and last window of weights instead.
+        half_length = self.smoothing_length // 2
+        if half_length > 0:
+            smoothed[:, :half_length] = weights[:, :self.smoothing_length].dot(self._sg_left_edge_coeffs.T)
+            smoothed[:, -half_length:] = weights[:, -self.smoothing_length:].dot(self._sg_right_edge_coeffs.T)
 
-        self.population.extend(offspring)
-        return offspring
+        return smoothed
 
     def calculate_fitness(self, candidate):
         """
@@ -167,37 +276,189 @@ class EvolutionaryStrategy:
         if (candidate.fitness):
             return candidate.fitness
 
-        line = RacingLine.generate_from_weights(candidate.weights, self.left_limit, self.right_limit)
-        lap_time_calculator = LapTimeCalculator()
-        candidate.lap_time = lap_time_calculator.calculate_lap_time(line, self.car, self.starting_velocity)
+        key = self.get_fitness_cache_key(candidate.weights)
+        candidate.lap_time = self.get_cached_fitness(key)
+        if candidate.lap_time is not None:
+            return candidate.fitness
+
+        line = self.generate_racing_line(candidate.weights)
+        candidate.lap_time = self.lap_time_calculator.calculate_lap_time(line, starting_velocity=self.starting_velocity)
+        self.cache_fitness(key, candidate.lap_time)
         return candidate.fitness
 
+    def get_fitness_cache_key(self, weights):
+        """
+        Method to get the key of a set of weights in the fitness cache. The weights are rounded to the number of
+        decimals of the cache, so that weights which only differ by less than that share the same key.
+
+        Args:
+            weights(list): List of weights of a candidate.
+
+        Returns:
+            key(bytes): Key of the weights in the fitness cache.
+
+        """
+        weights = np.round(np.asarray(weights, dtype=np.float64), self.fitness_cache_decimals)
+        return weights.astype(np.float32).tobytes()
+
+    def get_cached_fitness(self, key):
+        """
+        Method to get the fitness previously calculated for a set of weights.
+
+        Args:
+            key(bytes): Key of the weights of a candidate in the fitness cache (Refer to get_fitness_cache_key).
+
+        Returns:
+            fitness(float): Fitness calculated for the weights, or None if it is not in the cache.
+
+        """
+        fitness = self._fitness_cache.get(key)
+        if fitness is None:
+            self.fitness_cache_misses += 1
+        else:
+            self.fitness_cache_hits += 1
+            self._fitness_cache.move_to_end(key)
+
+        return fitness
+
+    def cache_fitness(self, key, fitness):
+        """
+        Method to remember the fitness calculated for a set of weights. The least recently used entry is evicted when
+        the cache is full.
+
+        Args:
+            key(bytes): Key of the weights of a candidate in the fitness cache (Refer to get_fitness_cache_key).
+            fitness(float): Fitness calculated for the weights.
+
+        """
+        if self.fitness_cache_size <= 0:
+            return
+
+        self._fitness_cache[key] = fitness
+        self._fitness_cache.move_to_end(key)
+        if len(self._fitness_cache) > self.fitness_cache_size:
+            self._fitness_cache.popitem(last=False)
+
     def perform_selection(self):
         """
-        Method to perform selection of Candidates in the population. The selection method is the Roulette-Wheel
-        selection.
+        Method to perform selection of Candidates in the population. The selection method is the Stochastic Universal
+        Sampling variant of the Roulette-Wheel selection.
 
         Returns:
             population(list): List of Candidates after performing selection.
 
         """
-        for candidate in self.population:
-            self.calculate_fitness(candidate)
+        self.evaluate_population()
+
+        fitness = np.fromiter((candidate.fitness for candidate in self.population), dtype=np.float64,
+                              count=len(self.population))
+
+        # Weighting each candidate by how much faster it is than the slowest candidate, as we have to minimize the lap
+        # time. The small offset keeps every candidate selectable.
+        probabilities = fitness.max() - fitness + SELECTION_EPSILON
+        probabilities /= probabilities.sum()
+
+        print("Best (Min) Fitness: {}".format(fitness.min()))
+        print("Average Fitness: {}".format(fitness.mean()))
+
+        # Stochastic Universal Sampling picks all the candidates with a single random draw, by placing evenly spaced
+        # pointers on the cumulative probabilities. A candidate may be selected more than once.
+        cumulative_probabilities = np.cumsum(probabilities)
+        pointers = self.rng.uniform(0.0, 1.0 / self.population_size) + \
+            (np.arange(self.population_size) / self.population_size)
+        indices = np.searchsorted(cumulative_probabilities, pointers)
+        np.minimum(indices, len(self.population) - 1, out=indices)
+        self.population = [self.population[idx] for idx in indices]
+        self.population_weights = self.population_weights[indices]
+        return self.population
 
-        population_fitness = sum([candidate.fitness for candidate in self.population])
-        probabilities = [candidate.fitness / population_fitness for candidate in self.population]
+    def evaluate_population(self):
+        """
+        Method to evaluate the fitness of all the candidates in the population that have not been evaluated yet. The
+        candidates are evaluated together in a single batch (Refer to calculate_lap_times).
 
-        # Taking the complement of the probabilities as we have to minimize the lap time.
-        probabilities = 1 - np.array(probabilities)
-        probabilities = probabilities / probabilities.sum()
+        Returns:
+            population(list): List of Candidates in the population.
 
-        print("Best (Min) Fitness: {}".format(min([candidate.fitness for candidate in self.population])))
-        print("Average Fitness: {}".format(population_fitness / len(self.population)))
+        """
+        pending = []
+        pending_keys = []
+        for candidate in self.population:
+            if candidate.fitness is None:
+                key = self.get_fitness_cache_key(candidate.weights)
+                candidate.lap_time = self.get_cached_fitness(key)
+                if candidate.lap_time is None:
+                    pending.append(candidate)
+                    pending_keys.append(key)
+
+        if not pending:
+            return self.population
+
+        lap_times = self.calculate_lap_times(np.vstack([candidate.weights for candidate in pending]))
+        for candidate, key, lap_time in zip(pending, pending_keys, lap_times):
+            candidate.lap_time = float(lap_time)
+            self.cache_fitness(key, candidate.lap_time)
 
-        self.population = list(np.random.choice(self.population, size=self.population_size, replace=False,
-                                                p=probabilities))
         return self.population
 
+    def calculate_lap_times(self, weights):
+        """
+        Method to calculate the lap times of the racing lines generated from the weights of a batch of candidates. The
+        candidates are evaluated by the process pool of the strategy if it is running, or by the multi-threaded lap
+        simulation kernel otherwise.
+
+        Args:
+            weights(np.array): Weights of each candidate, with one row per candidate.
+
+        Returns:
+            lap_times(list): Lap time of each candidate in seconds.
+
+        """
+        if self._pool:
+            chunksize = max(1, len(weights) // (self.num_workers * 4))
+            return self._pool.map(_evaluate_weights, list(weights), chunksize)
+
+        return self.lap_time_calculator.calculate_lap_times(weights, self.left_limit, self.limit_offsets,
+                                                            starting_velocity=self.starting_velocity)
+
+    def create_pool(self):
+        """
+        Method to create the process pool used to evaluate the fitness of candidates in parallel. The worker processes
+        receive the track limits and the car once, after which only weights are sent to them.
+
+        Returns:
+            pool(multiprocessing.pool.Pool): Process pool with the number of workers of the strategy.
+
+        """
+        initargs = (self.left_limit, self.right_limit, self.car, self.starting_velocity)
+        context = multiprocessing.get_context(POOL_START_METHOD)
+        return context.Pool(self.num_workers, initializer=_initialize_worker, initargs=initargs)
+
+    @contextlib.contextmanager
+    def pool_context(self, use_pool):
+        """
+        Context manager that runs a process pool for the duration of a run of the strategy. The candidates are
+        evaluated by the pool while it is running, and the pool is always detached from the strategy on exit so that
+        later evaluations fall back to the lap simulation kernel.
+
+        Args:
+            use_pool(bool): Whether to run a process pool.
+
+        Yields:
+            pool(multiprocessing.pool.Pool): Running process pool, or None if no pool is used.
+
+        """
+        if not use_pool:
+            yield None
+            return
+
+        try:
+            with self.create_pool() as pool:
+                self._pool = pool
+                yield pool
+        finally:
+            self._pool = None
+
     def run(self):
         """
         Method to run the strategy.
@@ -206,19 +467,17 @@ class EvolutionaryStrategy:
             best_candidate(Candidate): Candidate with the best fitness (least lap time) in the final population.
 
         """
-        self.generate_population()
+        with self.pool_context(bool(self.num_workers)):
+            self.generate_population()
 
-        for generation in range(self.iterations):
-            print("Generation {}".format(generation))
-            self.generate_offspring()
-            self.perform_selection()
-            print("")
+            for generation in range(self.iterations):
+                print("Generation {}".format(generation))
+                self.generate_offspring()
+                self.perform_selection()
+                print("")
 
-        best_candidate = self.population[0]
-        for idx in range(1, self.population_size):
-            # Select the candidate with the least lap time.
-            if (self.population[idx].fitness < best_candidate.fitness):
-                best_candidate = self.population[idx]
+        # Select the candidate with the least lap time.
+        best_candidate = min(self.population, key=lambda candidate: candidate.lap_time)
 
         print("Best fitness after running the algorithm: {}".format(best_candidate.fitness))
         return best_candidate
@@ -8,14 +8,13 @@ import struct
 
 import bmesh
 import bpy
-from mathutils import Vector
 
 from car import Car
 from cma_evolutionary_strategy import CMAEvolutionaryStrategy
 from evolutionary_strategy import EvolutionaryStrategy
 from lap_time_calculator import LapTimeCalculator
 from racing_line import RacingLine
-from utils import generate_mesh_from_vertices
+from utils import generate_mesh_from_vertices, get_world_vertex_coordinates
 
 TRACK_FILE_NAME = "fast_lane.ai"
 BORDER_LEFT_NAME = "border_left6"
@@ -24,15 +23,16 @@ BORDER_RIGHT_NAME = "border_right7"
 left_lane_name = TRACK_FILE_NAME + "_" + BORDER_LEFT_NAME
 right_lane_name = TRACK_FILE_NAME + "_" + BORDER_RIGHT_NAME
 
-left_lane = bpy.data.objects[left_lane_name]
-right_lane = bpy.data.objects[right_lane_name]
+left_lane, right_lane = (bpy.data.objects[name] for name in (left_lane_name, right_lane_name))
 
-left_locs = [left_lane.matrix_world @ vertex.co for vertex in left_lane.data.vertices]
-right_locs = [right_lane.matrix_world @ vertex.co for vertex in right_lane.data.vertices]
-left_line = RacingLine(left_locs)
-right_line = RacingLine(right_locs)
+# Reading the world space vertex coordinates of both borders in bulk, straight into the vertex arrays of the racing
+# lines.
+left_coords = get_world_vertex_coordinates(left_lane)
+right_coords = get_world_vertex_coordinates(right_lane)
+left_line = RacingLine(left_coords)
+right_line = RacingLine(right_coords)
 car = Car()
-lap_time_calculator = LapTimeCalculator()
+lap_time_calculator = LapTimeCalculator(car)
 
 print("The track distance is " + str(left_line.length) + "m.")
 sector_0 = left_line.get_sector(0)
@@ -48,3 +48,5 @@ strategy = CMAEvolutionaryStrategy(left_line, right_line, car, starting_velocity
 best_candidate = strategy.run()
 r_line = RacingLine.generate_from_weights(best_candidate.weights, left_line, right_line)
 generate_mesh_from_vertices(r_line.vertices)
+lap_time_calculator.plot_velocity_profile(r_line, car, 80.0)
+lap_time_calculator.plot_telemetry(r_line, car, 80.0)
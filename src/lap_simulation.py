@@ -0,0 +1,326 @@
+"""
+Module implementing the JIT compiled lap simulation used to calculate lap times.
+"""
+
+import math
+
+import numpy as np
+from numba import njit, prange
+
+from car import ACCELERATION_MULTIPLIERS, ACCELERATION_THRESHOLDS, ENGINE_POWER_MULTIPLIERS, ENGINE_POWER_THRESHOLDS
+
+# Fast math flags for the simulation kernels. The flags that assume no infinities or NaNs are left out as straight
+# sectors have an infinite radius.
+FASTMATH_FLAGS = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+# Squared sine of the sector angle below which the vertices of a sector are treated as colinear, and the sector as a
+# straight with an infinite radius. Such a radius would be more than 10^10 times the sector chord, which has no effect
+# on the maximum velocity through it.
+COLINEAR_EPSILON = 1e-20
+
+
+@njit(cache=True, fastmath=FASTMATH_FLAGS)
+def get_engine_power(velocity, base_engine_power, max_engine_power):
+    """
+    Gets the engine power of a car at a particular velocity. Mirrors Car.get_engine_power.
+
+    Args:
+        velocity(float): Velocity of the car in m/s.
+        base_engine_power(float): Base engine power of the car in watts.
+        max_engine_power(float): Maximum engine power of the car in watts.
+
+    Returns:
+        engine_power(float): Engine power of the car at the given velocity in watts.
+
+    """
+    idx = 0
+    while idx < len(ENGINE_POWER_THRESHOLDS) and velocity >= ENGINE_POWER_THRESHOLDS[idx]:
+        idx = idx + 1
+
+    if idx == 0 or idx == len(ENGINE_POWER_THRESHOLDS):
+        return max_engine_power
+
+    return base_engine_power + ((max_engine_power - base_engine_power) * ENGINE_POWER_MULTIPLIERS[idx])
+
+
+@njit(cache=True, fastmath=FASTMATH_FLAGS)
+def get_max_acceleration(velocity, max_velocity, max_acceleration):
+    """
+    Gets the maximum acceleration a car can have at a given velocity. Mirrors Car.get_max_acceleration.
+
+    Args:
+        velocity(float): Velocity that the car is currently running at in m/s.
+        max_velocity(float): Maximum velocity of the car in m/s.
+        max_acceleration(float): Maximum acceleration of the car in m/s^2.
+
+    Returns:
+        acceleration(float): The maximum acceleration of the car at the given velocity in m/s^2.
+
+    """
+    idx = 0
+    while idx < len(ACCELERATION_THRESHOLDS) and velocity >= ACCELERATION_THRESHOLDS[idx]:
+        idx = idx + 1
+
+    if idx == len(ACCELERATION_THRESHOLDS) and velocity >= max_velocity:
+        return 0.0
+
+    return max_acceleration * ACCELERATION_MULTIPLIERS[idx]
+
+
+@njit(cache=True, fastmath=FASTMATH_FLAGS)
+def get_sector_max_velocity(mass_over_radius, car_params):
+    """
+    Gets the maximum velocity a car can take around a sector. Mirrors LapTimeCalculator.get_sector_max_velocity.
+
+    Args:
+        mass_over_radius(float): Mass of the car divided by the radius of the sector in kg/m.
+        car_params(tuple): Parameters of the car (Refer to Car.simulation_parameters).
+
+    Returns:
+        velocity(float): The maximum velocity a car can go while travelling in the sector in m/s.
+
+    """
+    max_velocity, _, _, _, sqrt_total_force, drag_constant, _, _ = car_params
+    denom = (mass_over_radius * mass_over_radius) + (drag_constant * drag_constant)
+    denom = math.sqrt(math.sqrt(denom))
+    velocity = sqrt_total_force / denom
+    velocity = min(velocity, max_velocity)
+    return velocity
+
+
+@njit(cache=True, fastmath=FASTMATH_FLAGS)
+def get_sector_entry_velocity(mass_over_radius, length, car_params, exit_velocity):
+    """
+    Gets the entry velocity of a car through a sector from an exit velocity through braking.
+    Mirrors LapTimeCalculator.get_sector_entry_velocity.
+
+    Args:
+        mass_over_radius(float): Mass of the car divided by the radius of the sector in kg/m.
+        length(float): Length of the sector in metres.
+        car_params(tuple): Parameters of the car (Refer to Car.simulation_parameters).
+        exit_velocity(float): Velocity with which the car exits the sector in m/s.
+
+    Returns:
+        entry_velocity(float): The maximum entry velocity of a car going into the sector in m/s.
+
+    """
+    max_velocity, _, mass, total_force, _, drag_constant, _, _ = car_params
+    squared_velocity = exit_velocity * exit_velocity
+    centripetal_force = mass_over_radius * squared_velocity
+    braking_force = math.sqrt((total_force * total_force) - (centripetal_force * centripetal_force))
+    drag_force = drag_constant * squared_velocity
+    decelerative_force = braking_force + drag_force
+    delta_velocity = 2 * length * decelerative_force / mass
+    entry_velocity = math.sqrt(squared_velocity + delta_velocity)
+    entry_velocity = min(entry_velocity, max_velocity)
+    return entry_velocity
+
+
+@njit(cache=True, fastmath=FASTMATH_FLAGS)
+def get_sector_exit_velocity(length, car_params, entry_velocity):
+    """
+    Gets the exit velocity of a car through a sector from an entry velocity through acceleration.
+    Mirrors LapTimeCalculator.get_sector_exit_velocity.
+
+    Args:
+        length(float): Length of the sector in metres.
+        car_params(tuple): Parameters of the car (Refer to Car.simulation_parameters).
+        entry_velocity(float): Velocity with which the car enters the sector in m/s.
+
+    Returns:
+        exit_velocity(float): The maximum exit velocity of a car going out of the sector in m/s.
+
+    """
+    max_velocity, max_acceleration, mass, _, _, drag_constant, base_engine_power, max_engine_power = car_params
+    squared_velocity = entry_velocity * entry_velocity
+    drag_force = drag_constant * squared_velocity
+    power = get_engine_power(entry_velocity, base_engine_power, max_engine_power)
+    p_velocity = 1.0 if entry_velocity == 0.0 else entry_velocity
+    acceleration = ((power / p_velocity) - drag_force) / mass
+    limit = get_max_acceleration(entry_velocity, max_velocity, max_acceleration)
+    acceleration = min(acceleration, limit)
+    exit_velocity = math.sqrt(squared_velocity + (2 * acceleration * length))
+    exit_velocity = min(exit_velocity, max_velocity)
+    return exit_velocity
+
+
+@njit(cache=True, fastmath=FASTMATH_FLAGS)
+def simulate_lap(mass_over_radii, lengths, car_params, starting_velocity):
+    """
+    Simulates a car driving a lap around a racing line. Mirrors the passes in LapTimeCalculator.calculate_lap_time.
+    Calculation reference: http://www.jameshakewill.com/Lap_Time_Simulation.pdf (Pages 15 and 18)
+
+    Args:
+        mass_over_radii(np.array): Mass of the car divided by the radius of each sector in the racing line in kg/m.
+        lengths(np.array): Length of each sector in the racing line in metres.
+        car_params(tuple): Parameters of the car (Refer to Car.simulation_parameters).
+        starting_velocity(float): Velocity at which the car starts on the racing line in m/s.
+
+    Returns:
+        lap_time(float): Lap time taken by the car to drive around the racing line in seconds.
+        exit_velocities(np.array): Velocity with which the car exits each sector in m/s.
+
+    """
+    num_sectors = len(mass_over_radii)
+    entry_velocities = np.empty(num_sectors)
+    exit_velocities = np.empty(num_sectors)
+    entry_velocity = starting_velocity
+
+    # First pass to find the exit velocities of each sector (to apply acceleration/deceleration).
+    for idx in range(num_sectors):
+        exit_velocity = get_sector_exit_velocity(lengths[idx], car_params, entry_velocity)
+        max_sector_velocity = get_sector_max_velocity(mass_over_radii[idx], car_params)
+        entry_velocity = min(entry_velocity, max_sector_velocity)
+        exit_velocity = min(exit_velocity, max_sector_velocity)
+        entry_velocities[idx] = entry_velocity
+        exit_velocities[idx] = exit_velocity
+        entry_velocity = exit_velocity
+
+    # Second pass to adjust the entry velocities of each sector based on the exit velocities (to apply braking). A
+    # sector is not changed again once the pass has moved on from it, so its time is added to the lap time right away.
+    lap_time = 0.0
+    last_sector_idx = 0
+    for current_sector_idx in range(num_sectors - 1, -1, -1):
+        if exit_velocities[current_sector_idx] > entry_velocities[last_sector_idx]:
+            max_entry_velocity = get_sector_entry_velocity(
+                mass_over_radii[current_sector_idx], lengths[current_sector_idx], car_params,
+                entry_velocities[last_sector_idx])
+            entry_velocities[current_sector_idx] = min(entry_velocities[current_sector_idx], max_entry_velocity)
+            exit_velocities[current_sector_idx] = entry_velocities[last_sector_idx]
+
+        sector_velocity = entry_velocities[current_sector_idx] + exit_velocities[current_sector_idx]
+        lap_time = lap_time + (2 * lengths[current_sector_idx] / sector_velocity)
+        last_sector_idx = current_sector_idx
+
+    return lap_time, exit_velocities
+
+
+@njit(cache=True)
+def get_squared_distance(vertices, start_idx, end_idx):
+    """
+    Gets the squared distance between two vertices without creating any temporary arrays. The distance is calculated
+    in double precision, as the vertices may be stored in single precision.
+
+    Args:
+        vertices(np.array): Vertices of the racing line, with one row per vertex.
+        start_idx(int): Index of the first vertex.
+        end_idx(int): Index of the second vertex.
+
+    Returns:
+        squared_distance(float): Squared distance between the vertices in m^2.
+
+    """
+    squared_distance = 0.0
+    for axis in range(vertices.shape[1]):
+        delta = np.float64(vertices[end_idx, axis]) - np.float64(vertices[start_idx, axis])
+        squared_distance = squared_distance + (delta * delta)
+
+    return squared_distance
+
+
+@njit(cache=True)
+def get_squared_cross_product(vertices, start_idx, mid_idx, end_idx):
+    """
+    Gets the squared magnitude of the cross product of the two segments of a sector.
+
+    Args:
+        vertices(np.array): Vertices of the racing line, with one row per vertex.
+        start_idx(int): Index of the start vertex of the sector.
+        mid_idx(int): Index of the middle vertex of the sector.
+        end_idx(int): Index of the end vertex of the sector.
+
+    Returns:
+        squared_cross_product(float): Squared magnitude of the cross product in m^4.
+
+    """
+    ux = np.float64(vertices[mid_idx, 0]) - np.float64(vertices[start_idx, 0])
+    uy = np.float64(vertices[mid_idx, 1]) - np.float64(vertices[start_idx, 1])
+    uz = np.float64(vertices[mid_idx, 2]) - np.float64(vertices[start_idx, 2])
+    vx = np.float64(vertices[end_idx, 0]) - np.float64(vertices[mid_idx, 0])
+    vy = np.float64(vertices[end_idx, 1]) - np.float64(vertices[mid_idx, 1])
+    vz = np.float64(vertices[end_idx, 2]) - np.float64(vertices[mid_idx, 2])
+    cx = (uy * vz) - (uz * vy)
+    cy = (uz * vx) - (ux * vz)
+    cz = (ux * vy) - (uy * vx)
+    return (cx * cx) + (cy * cy) + (cz * cz)
+
+
+# The sector geometry is calculated without fast math, as the straight sector check compares the sector cosine exactly.
+# It is not parallelized either, as it runs inside the parallel loop of evaluate_population and a single racing line is
+# too short for threading to pay off.
+@njit(cache=True)
+def get_sector_geometry(vertices):
+    """
+    Gets the radius and length of each sector of a racing line. Mirrors RacingLine.sectors, Sector.radius and
+    Sector.length.
+
+    Args:
+        vertices(np.array): Vertices of the racing line, with one row per vertex.
+
+    Returns:
+        radii(np.array): Radius of each sector in metres.
+        lengths(np.array): Length of each sector in metres.
+
+    """
+    num_vertices = len(vertices)
+    num_sectors = (num_vertices + 1) // 2
+    half = num_vertices // 2
+    radii = np.empty(num_sectors)
+    lengths = np.empty(num_sectors)
+
+    for sector_idx in range(num_sectors):
+        idx = sector_idx % half if sector_idx >= half else sector_idx
+        start_idx = idx * 2
+        mid_idx = (start_idx + 1) % num_vertices
+        end_idx = (start_idx + 2) % num_vertices
+        a_squared = get_squared_distance(vertices, start_idx, end_idx)
+        b_squared = get_squared_distance(vertices, mid_idx, end_idx)
+        c_squared = get_squared_distance(vertices, start_idx, mid_idx)
+        b = math.sqrt(b_squared)
+        c = math.sqrt(c_squared)
+        lengths[sector_idx] = c + b
+
+        # Colinear sectors are straights, so the angle calculation is skipped for them.
+        squared_cross_product = get_squared_cross_product(vertices, start_idx, mid_idx, end_idx)
+        if squared_cross_product <= COLINEAR_EPSILON * b_squared * c_squared:
+            radii[sector_idx] = math.inf
+            continue
+
+        cos_angle = (c_squared + b_squared - a_squared) / (2 * b * c)
+        cos_angle = min(max(cos_angle, -1.0), 1.0)
+        if cos_angle == 1.0 or cos_angle == -1.0:
+            radii[sector_idx] = math.inf
+        else:
+            radii[sector_idx] = math.sqrt(a_squared) / (2 * math.sqrt(1.0 - (cos_angle * cos_angle)))
+
+    return radii, lengths
+
+
+@njit(cache=True, parallel=True, fastmath=FASTMATH_FLAGS)
+def evaluate_population(weights, left_vertices, limit_offsets, car_params, starting_velocity, lap_times):
+    """
+    Calculates the lap time of the racing line generated from the weights of each candidate in a population. The
+    candidates are evaluated in parallel on all the available CPU cores.
+
+    Args:
+        weights(np.array): Weights of each candidate, with one row per candidate.
+        left_vertices(np.array): Vertices of the left side track limit, with one row per vertex.
+        limit_offsets(np.array): Offset from each vertex of the left side track limit to the same vertex of the right
+            side track limit, with one row per vertex.
+        car_params(tuple): Parameters of the car (Refer to Car.simulation_parameters).
+        starting_velocity(float): Velocity at which the car starts on the racing line in m/s.
+        lap_times(np.array): Output array for the lap time of each candidate in seconds.
+
+    """
+    mass = car_params[2]
+    for pos in prange(weights.shape[0]):
+        # Generating the racing line in the same way as RacingLine.generate_from_weights.
+        vertices = np.empty_like(left_vertices)
+        for idx in range(len(left_vertices)):
+            weight = min(max(weights[pos, idx], 0.0), 1.0)
+            vertices[idx] = left_vertices[idx] + (limit_offsets[idx] * weight)
+
+        radii, lengths = get_sector_geometry(vertices)
+        mass_over_radii = mass / radii
+        lap_time, _ = simulate_lap(mass_over_radii, lengths, car_params, starting_velocity)
+        lap_times[pos] = lap_time
@@ -2,9 +2,12 @@
 Module to calculate lap times for a given car and racing line.
 """
 
+import math
+
+import numpy as np
 from matplotlib import pyplot
 
-from constants import AIR_DENSITY, GRAV_ACCELERATION
+from lap_simulation import evaluate_population, simulate_lap
 
 
 class LapTimeCalculator:
@@ -12,83 +15,171 @@ class LapTimeCalculator:
     Class to calculate lap times for a given car and racing line.
     """
 
-    def __init__(self):
+    def __init__(self, car=None):
         """
         Method to initialize the lap time calculator.
+
+        Args:
+            car(Car): Car to calculate lap times for when no car is given to a calculation. The constants derived from
+                the parameters of the car are computed once by the car itself (Refer to Car.simulation_parameters).
+                Defaults to None.
+
         """
-        pass
+        self.car = car
 
-    def calculate_lap_time(self, racing_line, car, starting_velocity=0.0, draw_graph=True):
+    def calculate_lap_time(self, racing_line, car=None, starting_velocity=0.0, draw_graph=False):
         """
         Method to calculate the lap time of a car moving along a racing line.
         Calculation reference: http://www.jameshakewill.com/Lap_Time_Simulation.pdf (Pages 15 and 18)
 
         Args:
             racing_line(RacingLine): Racing line for the car to drive around.
-            car(Car): Car that will drive on the racing line.
+            car(Car): Car that will drive on the racing line. Defaults to None, in which case the car of the calculator
+                is used.
             starting_velocity(float): Velocity at which the car starts on the racing line in m/s. Defaults to 0.0.
-            draw_graph(bool): Whether to plot the graph of exit velocity v/s sector time. Defaults to True.
+            draw_graph(bool): Whether to plot the graph of exit velocity v/s distance (Refer to plot_velocity_profile).
+                Defaults to False.
 
         Returns:
             lap_time(float): Lap time taken by the car to drive around the racing line in seconds.
 
         """
-        sectors = racing_line.sectors
-        entry_velocity = starting_velocity
-        entry_velocities = []
-        exit_velocities = []
-
-        # First pass to find the exit velocities of each sector (to apply acceleration/deceleration).
-        for sector in sectors:
-            exit_velocity = self.get_sector_exit_velocity(sector, car, entry_velocity)
-            max_sector_velocity = self.get_sector_max_velocity(sector, car)
-            entry_velocity = max_sector_velocity if entry_velocity > max_sector_velocity else entry_velocity
-            exit_velocity = max_sector_velocity if exit_velocity > max_sector_velocity else exit_velocity
-            entry_velocities.append(entry_velocity)
-            exit_velocities.append(exit_velocity)
-            entry_velocity = exit_velocity
-
-        # Second pass to adjust the entry velocities of each sector based on the exit velocities (to apply braking).
-        last_sector_idx = 0
-        for current_sector_idx in reversed(range(len(sectors))):
-            if (exit_velocities[current_sector_idx] > entry_velocities[last_sector_idx]):
-                max_entry_velocity = self.get_sector_entry_velocity(
-                    sectors[current_sector_idx], car, entry_velocities[last_sector_idx])
-                if entry_velocities[current_sector_idx] > max_entry_velocity:
-                    entry_velocities[current_sector_idx] = max_entry_velocity
-                exit_velocities[current_sector_idx] = entry_velocities[last_sector_idx]
-
-            last_sector_idx = current_sector_idx
-
-        # Calculate the time taken for each sector.
-        sector_times = []
-        for idx in range(len(sectors)):
-            sector_time = 2 * sectors[idx].length / (entry_velocities[idx] + exit_velocities[idx])
-            sector_times.append(sector_time)
-
-        dist_sum = 0
-        distances = []
-        for sector in sectors:
-            dist_sum = dist_sum + sector.length
-            distances.append(dist_sum)
-
-        # Plotting a graph of the track distance v/s the velocity at that point.
+        lap_time, exit_velocities = self.get_velocity_profile(racing_line, car, starting_velocity)
         if draw_graph:
-            pyplot.clf()
-            pyplot.plot(distances, exit_velocities, label="Line")
-            pyplot.xlabel("Distance (m)")
-            pyplot.ylabel("Exit Velocity (m/s)")
-            pyplot.title("Velocity Graph")
-            pyplot.legend()
-            pyplot.savefig("velocity_graph.png")
-
-        # Calculating the lap time from the sector times.
-        lap_time = 0.0
-        for sector_time in sector_times:
-            lap_time = lap_time + sector_time
+            self.draw_velocity_graph(racing_line.sector_distances, exit_velocities)
+
+        return lap_time
+
+    def plot_velocity_profile(self, racing_line, car=None, starting_velocity=0.0, file_name="velocity_graph.png"):
+        """
+        Method to plot the graph of the exit velocity of a car v/s the distance along a racing line and save it to
+        a file.
+
+        Args:
+            racing_line(RacingLine): Racing line for the car to drive around.
+            car(Car): Car that will drive on the racing line. Defaults to None, in which case the car of the calculator
+                is used.
+            starting_velocity(float): Velocity at which the car starts on the racing line in m/s. Defaults to 0.0.
+            file_name(str): Name of the file to save the graph to. Defaults to "velocity_graph.png".
+
+        Returns:
+            lap_time(float): Lap time taken by the car to drive around the racing line in seconds.
+
+        """
+        lap_time, exit_velocities = self.get_velocity_profile(racing_line, car, starting_velocity)
+        self.draw_velocity_graph(racing_line.sector_distances, exit_velocities, file_name)
+        return lap_time
+
+    def plot_telemetry(self, racing_line, car=None, starting_velocity=0.0, file_name="telemetry_graph.png"):
+        """
+        Method to plot the graphs of the engine power and the maximum acceleration of a car v/s the distance along a
+        racing line and save them to a file. The engine power and acceleration ranges of the car are looked up for the
+        exit velocities of all the sectors at once.
+
+        Args:
+            racing_line(RacingLine): Racing line for the car to drive around.
+            car(Car): Car that will drive on the racing line. Defaults to None, in which case the car of the calculator
+                is used.
+            starting_velocity(float): Velocity at which the car starts on the racing line in m/s. Defaults to 0.0.
+            file_name(str): Name of the file to save the graphs to. Defaults to "telemetry_graph.png".
 
+        Returns:
+            lap_time(float): Lap time taken by the car to drive around the racing line in seconds.
+
+        """
+        car = self.car if car is None else car
+        lap_time, exit_velocities = self.get_velocity_profile(racing_line, car, starting_velocity)
+        distances = racing_line.sector_distances
+
+        pyplot.clf()
+        power_axes = pyplot.subplot(2, 1, 1)
+        power_axes.plot(distances, car.get_engine_power_batch(exit_velocities) / 1000.0, label="Line")
+        power_axes.set_ylabel("Engine Power (kW)")
+        power_axes.set_title("Telemetry Graph")
+        power_axes.legend()
+
+        acceleration_axes = pyplot.subplot(2, 1, 2, sharex=power_axes)
+        acceleration_axes.plot(distances, car.get_max_acceleration_batch(exit_velocities), label="Line")
+        acceleration_axes.set_xlabel("Distance (m)")
+        acceleration_axes.set_ylabel("Max Acceleration (m/s^2)")
+        acceleration_axes.legend()
+        pyplot.savefig(file_name)
         return lap_time
 
+    def get_velocity_profile(self, racing_line, car=None, starting_velocity=0.0):
+        """
+        Method to simulate a car driving a lap around a racing line and get the exit velocity of each sector.
+
+        Args:
+            racing_line(RacingLine): Racing line for the car to drive around.
+            car(Car): Car that will drive on the racing line. Defaults to None, in which case the car of the calculator
+                is used.
+            starting_velocity(float): Velocity at which the car starts on the racing line in m/s. Defaults to 0.0.
+
+        Returns:
+            lap_time(float): Lap time taken by the car to drive around the racing line in seconds.
+            exit_velocities(np.array): Velocity with which the car exits each sector in m/s.
+
+        """
+        car = self.car if car is None else car
+
+        # The sector geometry is cached by the racing line. The sector radii only appear as the mass of the car over
+        # the radius, so the division is done once here.
+        radii, lengths = racing_line.radii_and_lengths()
+        mass_over_radii = car.mass / radii
+        lap_time, exit_velocities = simulate_lap(mass_over_radii, lengths, car.simulation_parameters,
+                                                 float(starting_velocity))
+        return lap_time, exit_velocities
+
+    def draw_velocity_graph(self, distances, exit_velocities, file_name="velocity_graph.png"):
+        """
+        Method to plot a graph of the track distance v/s the exit velocity of each sector and save it to a file.
+
+        Args:
+            distances(np.array): Distance along the racing line at the end of each sector in metres.
+            exit_velocities(np.array): Velocity with which the car exits each sector in m/s.
+            file_name(str): Name of the file to save the graph to. Defaults to "velocity_graph.png".
+
+        """
+        pyplot.clf()
+        pyplot.plot(distances, exit_velocities, label="Line")
+        pyplot.xlabel("Distance (m)")
+        pyplot.ylabel("Exit Velocity (m/s)")
+        pyplot.title("Velocity Graph")
+        pyplot.legend()
+        pyplot.savefig(file_name)
+
+    def calculate_lap_times(self, weights, left_limit, limit_offsets, car=None, starting_velocity=0.0):
+        """
+        Method to calculate the lap times of a car moving along the racing lines generated from the weights of a
+        population of candidates. The candidates are evaluated in parallel.
+
+        Args:
+            weights(np.array): Weights of each candidate, with one row per candidate (Refer to
+                RacingLine.generate_from_weights).
+            left_limit(RacingLine): Left side track limit.
+            limit_offsets(np.array): Offset from each vertex of the left side track limit to the same vertex of the
+                right side track limit, with one row per vertex. Computed once per track, so that the racing lines
+                are generated without subtracting the track limits for every candidate.
+            car(Car): Car that will drive on the racing lines. Defaults to None, in which case the car of the
+                calculator is used.
+            starting_velocity(float): Velocity at which the car starts on the racing lines in m/s. Defaults to 0.0.
+
+        Returns:
+            lap_times(np.array): Lap time taken by the car to drive around each racing line in seconds.
+
+        """
+        car = self.car if car is None else car
+        # The weights are evaluated in the data type they are stored in, so a single precision population is not copied.
+        weights = np.ascontiguousarray(weights)
+        if not np.issubdtype(weights.dtype, np.floating):
+            weights = weights.astype(np.float64)
+
+        lap_times = np.empty(len(weights))
+        evaluate_population(weights, left_limit.vertex_array, limit_offsets, car.simulation_parameters,
+                            float(starting_velocity), lap_times)
+        return lap_times
+
     def get_sector_max_velocity(self, sector, car):
         """
         Gets the maximum velocity a car can take around a sector.
@@ -102,12 +193,11 @@ class LapTimeCalculator:
             velocity(float): The maximum velocity a car can go while travelling in a sector in m/s.
 
         """
-        total_force = car.friction * car.mass * GRAV_ACCELERATION
-        drag = car.drag_coefficient * 0.5 * AIR_DENSITY * car.frontal_area
-        denom = ((car.mass / sector.radius) ** 2) + (drag ** 2)
-        denom = denom ** (1.0 / 4.0)
-        velocity = (total_force ** (1.0 / 2.0)) / denom
-        velocity = car.max_velocity if velocity > car.max_velocity else velocity
+        mass_over_radius = car.mass / sector.radius
+        denom = (mass_over_radius * mass_over_radius) + (car.drag_constant * car.drag_constant)
+        denom = math.sqrt(math.sqrt(denom))
+        velocity = car.sqrt_total_force / denom
+        velocity = min(velocity, car.max_velocity)
         return velocity
 
     def get_sector_entry_velocity(self, sector, car, exit_velocity):
@@ -124,14 +214,14 @@ class LapTimeCalculator:
             entry_velocity(float): The maximum entry velocity of a car going into a given sector in m/s.
 
         """
-        total_force = car.friction * car.mass * GRAV_ACCELERATION
-        centripetal_force = car.mass * (exit_velocity ** 2) / sector.radius
-        braking_force = ((total_force ** 2) - (centripetal_force ** 2)) ** (1.0 / 2.0)
-        drag_force = car.drag_coefficient * 0.5 * AIR_DENSITY * (exit_velocity ** 2) * car.frontal_area
+        squared_velocity = exit_velocity * exit_velocity
+        centripetal_force = car.mass * squared_velocity / sector.radius
+        braking_force = math.sqrt((car.total_force * car.total_force) - (centripetal_force * centripetal_force))
+        drag_force = car.drag_constant * squared_velocity
         decelerative_force = braking_force + drag_force
         delta_velocity = 2 * sector.length * decelerative_force / car.mass
-        entry_velocity = ((exit_velocity ** 2) + delta_velocity) ** (1.0 / 2.0)
-        entry_velocity = car.max_velocity if entry_velocity > car.max_velocity else entry_velocity
+        entry_velocity = math.sqrt(squared_velocity + delta_velocity)
+        entry_velocity = min(entry_velocity, car.max_velocity)
         return entry_velocity
 
     def get_sector_exit_velocity(self, sector, car, entry_velocity):
@@ -148,13 +238,13 @@ class LapTimeCalculator:
             exit_velocity(float): The maximum exit velocity of a car going out a given sector in m/s.
 
         """
-        drag_force = car.drag_coefficient * 0.5 * AIR_DENSITY * (entry_velocity ** 2) * car.frontal_area
+        squared_velocity = entry_velocity * entry_velocity
+        drag_force = car.drag_constant * squared_velocity
         power = car.get_engine_power(entry_velocity)
         p_velocity = 1.0 if entry_velocity == 0.0 else entry_velocity
         acceleration = ((power / p_velocity) - drag_force) / car.mass
         max_acceleration = car.get_max_acceleration(entry_velocity)
-        acceleration = max_acceleration if acceleration > max_acceleration else acceleration
-        exit_velocity = ((entry_velocity ** 2) + (2 * acceleration * sector.length)) ** (1.0 / 2.0)
-        exit_velocity = car.max_velocity if exit_velocity > car.max_velocity else exit_velocity
+        acceleration = min(acceleration, max_acceleration)
+        exit_velocity = math.sqrt(squared_velocity + (2 * acceleration * sector.length))
+        exit_velocity = min(exit_velocity, car.max_velocity)
         return exit_velocity
-
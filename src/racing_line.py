@@ -4,7 +4,101 @@ Module for racing lines.
 
 import math
 
-from utils import clamp
+import numpy as np
+
+from lap_simulation import COLINEAR_EPSILON, get_sector_geometry
+
+try:
+    import simsimd
+except ImportError:
+    # SimSIMD is optional, the segment lengths fall back to NumPy when it is not installed.
+    simsimd = None
+
+__all__ = ["VERTEX_DTYPE", "RacingLine", "Sector", "get_segment_lengths"]
+
+# Data type of the vertices of a racing line. Single precision is accurate to well under a millimetre for the size of a
+# track, and halves the memory traffic of the geometry calculations over the vertices.
+VERTEX_DTYPE = np.float32
+
+
+def _get_squared_distance(start, end):
+    """
+    Method to get the squared distance between two points.
+
+    Args:
+        start(tuple): Coordinates of the first point.
+        end(tuple): Coordinates of the second point.
+
+    Returns:
+        squared_distance(float): Squared distance between the points in m^2.
+
+    """
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    dz = end[2] - start[2]
+    return (dx * dx) + (dy * dy) + (dz * dz)
+
+
+def _get_sector_radius(start, mid, end):
+    """
+    Method to calculate the radius of the path through the three vertices of a sector.
+
+    Args:
+        start(tuple): Coordinates of the start vertex of the sector.
+        mid(tuple): Coordinates of the middle vertex of the sector.
+        end(tuple): Coordinates of the end vertex of the sector.
+
+    Returns:
+        radius(float): Radius of the sector in metres.
+
+    """
+    # Only the squared distances are needed for the angle, so the distances themselves are never calculated.
+    a_squared = _get_squared_distance(end, start)
+    b_squared = _get_squared_distance(end, mid)
+    c_squared = _get_squared_distance(mid, start)
+
+    # Colinear sectors are straights, so the angle calculation is skipped for them.
+    ux, uy, uz = mid[0] - start[0], mid[1] - start[1], mid[2] - start[2]
+    vx, vy, vz = end[0] - mid[0], end[1] - mid[1], end[2] - mid[2]
+    cx = (uy * vz) - (uz * vy)
+    cy = (uz * vx) - (ux * vz)
+    cz = (ux * vy) - (uy * vx)
+    if (cx * cx) + (cy * cy) + (cz * cz) <= COLINEAR_EPSILON * b_squared * c_squared:
+        return math.inf
+
+    cos_angle = (c_squared + b_squared - a_squared) / (2 * math.sqrt(b_squared * c_squared))
+    cos_angle = min(max(cos_angle, -1.0), 1.0)
+
+    # A cosine of 1 or -1 means that the vertices are in a line, so the sector is a straight.
+    if cos_angle == 1.0 or cos_angle == -1.0:
+        return math.inf
+
+    # The sine of the sector angle is found from its cosine, as sin(pi - angle) = sin(angle) = sqrt(1 - cos^2(angle)).
+    radius = math.sqrt(a_squared) / (2 * math.sqrt(1.0 - (cos_angle * cos_angle)))
+    return radius
+
+
+def get_segment_lengths(segments):
+    """
+    Method to get the lengths of a set of segments. The squared lengths of all the segments are calculated in a single
+    pass over the segments, using the batched SIMD kernels of SimSIMD if it is installed. The lengths have the data
+    type of the segments, which is single precision for the segments of a racing line (Refer to VERTEX_DTYPE).
+
+    Args:
+        segments(np.array): Difference between the end and start vertex of each segment, with one row per segment.
+
+    Returns:
+        segment_lengths(np.array): Length of each segment in metres.
+
+    """
+    if simsimd is not None and len(segments) > 0:
+        # SimSIMD returns the row-wise dot products in double precision, so they are converted back to the data type of
+        # the segments.
+        squared_lengths = np.asarray(simsimd.dot(segments, segments), dtype=segments.dtype).reshape(-1)
+    else:
+        squared_lengths = np.einsum("ij,ij->i", segments, segments)
+
+    return np.sqrt(squared_lengths)
 
 
 class Sector:
@@ -13,6 +107,8 @@ class Sector:
     A sector is a path representing by 3 points in space, the start, the middle and an end.
     """
 
+    __slots__ = ("vertices", "start", "mid", "end")
+
     def __init__(self, vertices):
         """
         Method to initialize a sector.
@@ -36,22 +132,8 @@ class Sector:
             radius(float): Radius of the sector in metres.
 
         """
-        a = (self.end - self.start).length
-        b = (self.end - self.mid).length
-        c = (self.mid - self.start).length
-        cos_angle = ((c ** 2) + (b ** 2) - (a ** 2)) / (2 * b * c)
-
-        if cos_angle > 1:
-            cos_angle = 1
-        elif cos_angle < -1:
-            cos_angle = -1
-
-        sector_angle = math.acos(cos_angle)
-        if sector_angle == 0 or sector_angle == math.pi:
-            return math.inf
-
-        radius = a / (2 * math.sin(math.pi - sector_angle))
-        return radius
+        start, mid, end = (tuple(map(float, vertex)) for vertex in (self.start, self.mid, self.end))
+        return _get_sector_radius(start, mid, end)
 
     @property
     def length(self):
@@ -62,22 +144,15 @@ class Sector:
             length(float): Length of sector in metres.
 
         """
-        if not self.vertices:
-            return 0
-
-        length = 0
-        prev_vert = self.vertices[0]
-
-        for vertex in self.vertices:
-            length = length + (vertex - prev_vert).length
-            prev_vert = vertex
-
-        return length
+        return math.dist(self.start, self.mid) + math.dist(self.mid, self.end)
 
 
 class RacingLine:
     """
     Class representing a racing line.
+    The vertices are stored as a contiguous array with one row per vertex. The geometry of the sectors is calculated
+    once and cached, until new vertices are assigned to the racing line. If the vertices are modified in place,
+    invalidate_geometry has to be called.
     """
 
     def __init__(self, vertices=None):
@@ -85,12 +160,65 @@ class RacingLine:
         Method to initialize a racing line.
 
         Args:
-            vertices(list): List of vertices present in the racing line. Defaults to None.
+            vertices(list): List of vertices present in the racing line, or an array with one row per vertex. Defaults
+                to None.
+
+        """
+        self.vertices = vertices if vertices is not None else []
+
+    @property
+    def vertices(self):
+        """
+        Gets the vertices of a racing line.
+
+        Returns:
+            vertices(np.array): Array of the vertex locations, with one row per vertex.
+
+        """
+        return self._xyz
+
+    @vertices.setter
+    def vertices(self, vertices):
+        """
+        Sets the vertices of a racing line and invalidates the cached sector geometry.
+
+        Args:
+            vertices(list): List of vertices present in the racing line (such as blender vectors), or an array with one
+                row per vertex.
 
         """
-        self.vertices = []
-        if vertices is not None:
-            self.vertices = vertices
+        if not isinstance(vertices, np.ndarray):
+            vertices = [tuple(vertex) for vertex in vertices]
+
+        self._xyz = np.ascontiguousarray(vertices, dtype=VERTEX_DTYPE).reshape(-1, 3)
+        self._num_vertices = len(self._xyz)
+        self._half_num_vertices = self._num_vertices // 2
+
+        # Index of the next vertex of each vertex, wrapping around from the last vertex to the first one. Used to gather
+        # the next vertex of every vertex at once.
+        self._next_idx = np.roll(np.arange(self._num_vertices), -1)
+        self.invalidate_geometry()
+
+    def invalidate_geometry(self):
+        """
+        Method to clear the cached sector geometry, segments and vertex distances of a racing line, so that they are
+        calculated again the next time they are used.
+        """
+        self._radii = None
+        self._lengths = None
+        self._cumlen = None
+        self._segments = None
+        self._segment_lengths = None
+        self._vertex_distances = None
+
+    def _update_geometry(self):
+        """
+        Method to calculate the radius, length and cumulative distance of every sector of a racing line if they are not
+        cached yet.
+        """
+        if self._radii is None:
+            self._radii, self._lengths = get_sector_geometry(self.vertex_array)
+            self._cumlen = np.cumsum(self._lengths)
 
     @staticmethod
     def generate_from_weights(weights, left_limit, right_limit):
@@ -107,19 +235,33 @@ class RacingLine:
         Returns:
             racing_line(RacingLine): A racing line generated from the weights and the track limits.
 
+        """
+        return RacingLine.build_factory(left_limit, right_limit)(weights)
+
+    @staticmethod
+    def build_factory(left_limit, right_limit):
+        """
+        Method to build a function that generates racing lines from weights between a fixed pair of track limits (Refer
+        to RacingLine.generate_from_weights). The offset from the left to the right track limit is calculated once,
+        so generating each racing line only scales and adds it to the left track limit.
+
+        Args:
+            left_limit(RacingLine): Left side track limit.
+            right_limit(RacingLine): Right side track limit.
+
+        Returns:
+            generate_racing_line(function): Function that takes a list of weights, and returns the racing line
+                generated from them.
+
         """
         l_verts = left_limit.vertices
-        r_verts = right_limit.vertices
-        vertices = []
+        t_verts = right_limit.vertices - l_verts
 
-        for idx in range(len(l_verts)):
-            t_vec = r_verts[idx] - l_verts[idx]
-            weight = clamp(weights[idx], 0.0, 1.0)
-            vert = l_verts[idx] + (t_vec * weight)
-            vertices.append(vert)
+        def generate_racing_line(weights):
+            weights = np.clip(np.asarray(weights, dtype=l_verts.dtype), 0.0, 1.0)
+            return RacingLine(l_verts + (t_verts * weights[:, np.newaxis]))
 
-        racing_line = RacingLine(vertices)
-        return racing_line
+        return generate_racing_line
 
     def get_sector(self, idx):
         """
@@ -132,37 +274,142 @@ class RacingLine:
             sector(Sector): Sector of the given index.
 
         """
-        if (idx >= int(len(self.vertices) / 2)):
-            idx = idx % int((len(self.vertices) / 2))
+        idx %= self._half_num_vertices
 
-        # Given that there are 3 vertices in a sector, the sector index would be a third of the vertex index.
+        # Given that there are 3 vertices in a sector, the sector index would be a third of the vertex index. Scalar
+        # indices are wrapped with integer arithmetic, which is faster than looking them up in the next index array.
+        num_vertices = self._num_vertices
         start_idx = idx * 2
-        mid_idx = (start_idx + 1) % len(self.vertices)
-        end_idx = (start_idx + 2) % len(self.vertices)
+        mid_idx = (start_idx + 1) % num_vertices
+        end_idx = (start_idx + 2) % num_vertices
 
-        sector = Sector([self.vertices[start_idx], self.vertices[mid_idx], self.vertices[end_idx]])
+        xyz = self._xyz
+        sector = Sector([xyz[start_idx], xyz[mid_idx], xyz[end_idx]])
         return sector
 
+    def sector_view(self, idx):
+        """
+        Method to get the vertices of the sector at a given index without creating a sector object. Sectors that do not
+        wrap around to the start of the racing line are returned as a view into the vertex array. The vertices are
+        read-only, as the vertices of a racing line have to be assigned through RacingLine.vertices for the cached
+        geometry to be updated.
+
+        Args:
+            idx(int): Index of the the sector to get.
+
+        Returns:
+            vertices(np.array): Array of the start, middle and end vertex of the sector, with one row per vertex. The
+                array is empty if the racing line has no vertices.
+
+        """
+        num_vertices = self._num_vertices
+        if num_vertices == 0:
+            vertices = self._xyz[:0]
+        else:
+            if self._half_num_vertices:
+                idx %= self._half_num_vertices
+
+            start_idx = idx * 2
+            if start_idx + 2 < num_vertices:
+                vertices = self._xyz[start_idx:start_idx + 3]
+            else:
+                vertices = self._xyz[[start_idx, (start_idx + 1) % num_vertices, (start_idx + 2) % num_vertices]]
+
+        vertices.flags.writeable = False
+        return vertices
+
     @property
     def sectors(self):
         """
-        Method to get all the sectors in a racing line.
+        Gets all the sectors in a racing line. The sectors are created one at a time as they are iterated over, so
+        consumers that need the geometry of every sector should use radii_and_lengths instead.
 
         Returns:
-            sectors(list): Returns a list of all the sectors in the racing line.
+            sectors(generator): Generator of all the sectors in the racing line, in sector order.
+
+        """
+        return (self.get_sector(idx) for idx in range((self._num_vertices + 1) // 2))
 
+    @property
+    def vertex_array(self):
         """
-        if not self.vertices:
-            return []
+        Gets the vertices of a racing line as an array.
 
-        sectors = []
-        idx = 0
-        for _ in range(0, len(self.vertices), 2):
-            sector = self.get_sector(idx)
-            sectors.append(sector)
-            idx = idx + 1
+        Returns:
+            vertex_array(np.array): Array of the vertex locations, with one row per vertex.
+
+        """
+        return self._xyz
 
-        return sectors
+    def radii_and_lengths(self):
+        """
+        Method to get the radius and length of every sector in a racing line, calculated in a single batch over the
+        vertex array without creating any sector objects.
+
+        Returns:
+            radii(np.array): Array of the radius of each sector in metres, in sector order.
+            lengths(np.array): Array of the length of each sector in metres, in sector order.
+
+        """
+        self._update_geometry()
+        return self._radii, self._lengths
+
+    @property
+    def sector_distances(self):
+        """
+        Gets the distance along a racing line at the end of each sector.
+
+        Returns:
+            sector_distances(np.array): Array of the cumulative length of the sectors in metres, in sector order.
+
+        """
+        self._update_geometry()
+        return self._cumlen
+
+    @property
+    def segments(self):
+        """
+        Gets the segments joining each vertex of a racing line to the next one, wrapping around to the first vertex.
+        The segments are calculated once and cached.
+
+        Returns:
+            segments(np.array): Array of the difference between consecutive vertices, with one row per vertex. The last
+                row closes the racing line.
+
+        """
+        if self._segments is None:
+            self._segments = self._xyz[self._next_idx] - self._xyz
+
+        return self._segments
+
+    @property
+    def segment_lengths(self):
+        """
+        Gets the lengths of the segments of a racing line. The lengths are calculated once and cached.
+
+        Returns:
+            segment_lengths(np.array): Array of the length of each segment in metres (Refer to RacingLine.segments).
+
+        """
+        if self._segment_lengths is None:
+            self._segment_lengths = get_segment_lengths(self.segments)
+
+        return self._segment_lengths
+
+    @property
+    def vertex_distances(self):
+        """
+        Gets the distance along a racing line at each vertex. The distances are calculated once and cached.
+
+        Returns:
+            vertex_distances(np.array): Array of the cumulative length of the racing line in metres at each vertex.
+
+        """
+        if self._vertex_distances is None:
+            self._vertex_distances = np.zeros(len(self._xyz))
+            np.cumsum(self.segment_lengths[:-1], out=self._vertex_distances[1:])
+
+        return self._vertex_distances
 
     @property
     def length(self):
@@ -173,14 +420,7 @@ class RacingLine:
             length(float): Length of racing line in metres.
 
         """
-        if not self.vertices:
+        if len(self.vertices) == 0:
             return 0
 
-        length = 0
-        prev_vert = self.vertices[0]
-
-        for vertex in self.vertices:
-            length = length + (vertex - prev_vert).length
-            prev_vert = vertex
-
-        return length
+        return float(self.vertex_distances[-1])
@@ -2,9 +2,14 @@
 Module for implementing various utility functions.
 """
 
-import bpy
 import numpy as np
 
+try:
+    import bpy
+except ImportError:
+    # The blender API is only available when running inside blender, and is only needed to create meshes.
+    bpy = None
+
 
 def clamp(value, min_value, max_value):
     """
@@ -37,12 +42,34 @@ def en0i(n):
     return np.sqrt(n) * (1 - 1.0 / (4 * n) + 1.0 / (21 * n * n))
 
 
+def get_world_vertex_coordinates(obj):
+    """
+    Method to get the world space coordinates of all the vertices of a mesh object in blender. The coordinates are read
+    in a single bulk call and transformed by the world matrix of the object in one vectorized pass.
+
+    Args:
+        obj(bpy.types.Object): Mesh object to get the vertex coordinates of.
+
+    Returns:
+        coordinates(np.array): World space coordinates of the vertices of the object, with one row per vertex.
+
+    """
+    vertices = obj.data.vertices
+    coordinates = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get("co", coordinates)
+    coordinates = coordinates.reshape(-1, 3)
+
+    matrix_world = np.array(obj.matrix_world, dtype=np.float32)
+    return coordinates @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+
+
 def generate_mesh_from_vertices(vertices, mesh_name="racing_line", collection_name="Collection"):
     """
-    Method to generate a mesh in blender from a list of vertex locations.
+    Method to generate a mesh in blender from a list of vertex locations. The vertices are joined into a closed loop,
+    and both the vertex coordinates and the edges are written to the mesh in bulk.
 
     Args:
-        vertices(list): List of vertices to create the mesh from.
+        vertices(list): List of vertices to create the mesh from, or an array with one row per vertex.
         mesh_name(str): Name of the mesh to be created. Defaults to "racing_line".
         collection_name(str): Name of the collection to add the mesh to. Defaults to "Collection".
 
@@ -52,8 +79,17 @@ def generate_mesh_from_vertices(vertices, mesh_name="racing_line", collection_na
     col = bpy.data.collections.get(collection_name)
     col.objects.link(obj)
 
-    edges = []
-    for idx in range(len(vertices)):
-        edges.append([idx, (idx + 1) % len(vertices)])
+    coordinates = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+    num_vertices = len(coordinates)
+
+    # Joining each vertex to the next one, with the last vertex joined back to the first.
+    edges = np.empty((num_vertices, 2), dtype=np.int32)
+    edges[:, 0] = np.arange(num_vertices)
+    edges[:, 1] = np.arange(1, num_vertices + 1)
+    edges[-1:, 1] = 0
 
-    mesh.from_pydata(vertices, edges, [])
+    mesh.vertices.add(num_vertices)
+    mesh.vertices.foreach_set("co", coordinates.ravel())
+    mesh.edges.add(num_vertices)
+    mesh.edges.foreach_set("vertices", edges.ravel())
+    mesh.update()
@@ -0,0 +1,15 @@
+"""
+Configuration shared by the tests. The modules of the project are imported from the src directory, the same way they
+are imported by the blender script.
+"""
+
+import os
+import sys
+
+from helpers import SRC_DIR
+
+# The CUDA kernels are run on the CUDA simulator of numba unless told otherwise, so that they are tested without a GPU.
+# The simulator has to be enabled before numba is imported.
+os.environ.setdefault("NUMBA_ENABLE_CUDASIM", "1")
+
+sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,31 @@
+"""
+Helpers shared by the tests.
+"""
+
+import math
+import os
+
+import numpy as np
+
+# Directory containing the modules of the project.
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def make_track_limits(num_vertices=200, width=12.0):
+    """
+    Method to make the vertices of the track limits of a closed, winding test track.
+
+    Args:
+        num_vertices(int): Number of vertices in each track limit. Defaults to 200.
+        width(float): Width of the track in metres. Defaults to 12.0.
+
+    Returns:
+        left_vertices(np.array): Vertices of the left side track limit, with one row per vertex.
+        right_vertices(np.array): Vertices of the right side track limit, with one row per vertex.
+
+    """
+    angles = 2 * math.pi * np.arange(num_vertices) / num_vertices
+    radii = 800 + (200 * np.sin(3 * angles)) + (60 * np.cos(7 * angles))
+    normals = np.stack([np.cos(angles), np.sin(angles), np.zeros(num_vertices)], axis=1)
+    centre = radii[:, np.newaxis] * normals
+    return centre - (normals * width / 2), centre + (normals * width / 2)
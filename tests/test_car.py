@@ -0,0 +1,46 @@
+"""
+Tests for cars.
+"""
+
+import numpy as np
+import pytest
+
+from car import Car
+
+# Velocities on and around the thresholds of the engine power table, with the engine power of the default car at each
+# velocity in the original ladder of velocity ranges.
+ENGINE_POWER_CASES = [(-5.0, 800000.0), (-1e-9, 800000.0), (0.0, 240000.0), (9.999, 240000.0), (10.0, 450000.0),
+                      (39.999, 450000.0), (40.0, 590000.0), (69.999, 590000.0), (70.0, 730000.0), (89.999, 730000.0),
+                      (90.0, 800000.0), (150.0, 800000.0)]
+
+# Velocities on and around the thresholds of the acceleration table, with the maximum acceleration of the default car
+# at each velocity in the original ladder of velocity ranges. The last range ends at the maximum velocity of 100 m/s.
+ACCELERATION_CASES = [(-5.0, 0.0), (-1e-9, 0.0), (0.0, 11.625), (27.999, 11.625), (28.0, 15.5), (55.999, 15.5),
+                      (56.0, 6.975), (83.999, 6.975), (84.0, 4.65), (99.999, 4.65), (100.0, 0.0), (150.0, 0.0)]
+
+
+@pytest.mark.parametrize("velocity, engine_power", ENGINE_POWER_CASES)
+def test_engine_power_at_thresholds(velocity, engine_power):
+    car = Car()
+
+    assert car.get_engine_power(velocity) == pytest.approx(engine_power)
+    assert car.get_engine_power_batch([velocity])[0] == pytest.approx(engine_power)
+
+
+@pytest.mark.parametrize("velocity, acceleration", ACCELERATION_CASES)
+def test_max_acceleration_at_thresholds(velocity, acceleration):
+    car = Car()
+
+    assert car.get_max_acceleration(velocity) == pytest.approx(acceleration)
+    assert car.get_max_acceleration_batch([velocity])[0] == pytest.approx(acceleration)
+
+
+def test_batch_lookups_match_scalar_lookups():
+    car = Car()
+    thresholds = [0.0, 10.0, 28.0, 40.0, 56.0, 70.0, 84.0, 90.0, 100.0]
+    velocities = np.concatenate([np.linspace(-10.0, 120.0, 1301), thresholds])
+
+    np.testing.assert_array_equal(car.get_engine_power_batch(velocities),
+                                  [car.get_engine_power(velocity) for velocity in velocities])
+    np.testing.assert_array_equal(car.get_max_acceleration_batch(velocities),
+                                  [car.get_max_acceleration(velocity) for velocity in velocities])
@@ -0,0 +1,30 @@
+"""
+Tests for the CMA evolutionary strategy.
+"""
+
+import numpy as np
+import pytest
+
+from car import Car
+from cma_evolutionary_strategy import MATRIX_DTYPE, CMAEvolutionaryStrategy
+from helpers import make_track_limits
+from racing_line import RacingLine
+
+
+@pytest.mark.parametrize("population_size", [2, 7, 50])
+def test_empirical_covariance_matches_outer_products(population_size):
+    left_vertices, right_vertices = make_track_limits(60)
+    strategy = CMAEvolutionaryStrategy(RacingLine(left_vertices), RacingLine(right_vertices), Car(),
+                                       population_size=population_size, seed=3)
+    population = np.random.default_rng(3).random((population_size, strategy.candidate_length), dtype=MATRIX_DTYPE)
+    strategy.population_matrix[:] = population
+    covariance_matrix = strategy.generate_empirical_covariance_matrix()
+
+    # Sum of the outer product of every centered candidate with itself, over one less than the number of candidates.
+    population = population.astype(np.float64)
+    centered = population - population.mean(axis=0)
+    expected = sum(np.outer(row, row) for row in centered) / (population_size - 1)
+    np.testing.assert_allclose(covariance_matrix, expected, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(covariance_matrix, np.cov(population, rowvar=False), rtol=1e-5, atol=1e-6)
+    # Both triangles are filled, the lower one by mirroring the upper one written by BLAS.
+    np.testing.assert_array_equal(covariance_matrix, covariance_matrix.T)
@@ -0,0 +1,71 @@
+"""
+Tests for the CUDA kernels.
+"""
+
+import numpy as np
+import pytest
+
+from car import Car
+from cuda_kernels import CudaLapTimeEvaluator
+from evolutionary_strategy import WEIGHT_DTYPE
+from helpers import make_track_limits
+from lap_time_calculator import LapTimeCalculator
+from racing_line import RacingLine
+
+pytestmark = pytest.mark.skipif(not CudaLapTimeEvaluator.is_available(), reason="No CUDA GPU or simulator available.")
+
+
+def make_straight_track_limits(num_vertices=200, width=12.0, spacing=10.0):
+    """
+    Method to make the vertices of the track limits of a straight test track, which is closed by a single segment
+    back to the start.
+
+    Args:
+        num_vertices(int): Number of vertices in each track limit. Defaults to 200.
+        width(float): Width of the track in metres. Defaults to 12.0.
+        spacing(float): Distance between consecutive vertices in metres. Defaults to 10.0.
+
+    Returns:
+        left_vertices(np.array): Vertices of the left side track limit, with one row per vertex.
+        right_vertices(np.array): Vertices of the right side track limit, with one row per vertex.
+
+    """
+    left_vertices = np.zeros((num_vertices, 3))
+    left_vertices[:, 0] = np.arange(num_vertices) * spacing
+    right_vertices = left_vertices.copy()
+    right_vertices[:, 1] = width
+    return left_vertices, right_vertices
+
+
+def make_repeated_vertex_track_limits():
+    """
+    Method to make the vertices of the track limits of a winding test track whose second vertex is at the same position
+    as its first one, giving the first sector a side of zero length.
+
+    Returns:
+        left_vertices(np.array): Vertices of the left side track limit, with one row per vertex.
+        right_vertices(np.array): Vertices of the right side track limit, with one row per vertex.
+
+    """
+    left_vertices, right_vertices = make_track_limits()
+    left_vertices[1] = left_vertices[0]
+    right_vertices[1] = right_vertices[0]
+    return left_vertices, right_vertices
+
+
+@pytest.mark.parametrize("make_limits", [make_track_limits, make_straight_track_limits,
+                                         make_repeated_vertex_track_limits])
+def test_gpu_lap_times_match_cpu_lap_times(make_limits):
+    left_vertices, right_vertices = make_limits()
+    left_limit, right_limit = RacingLine(left_vertices), RacingLine(right_vertices)
+    car = Car()
+    # Random racing lines, and racing lines at a constant weight, which are straight on the straight track.
+    weights = np.vstack([np.random.default_rng(3).random((5, len(left_vertices)), dtype=WEIGHT_DTYPE),
+                         np.full((3, len(left_vertices)), [[0.0], [0.5], [1.0]], dtype=WEIGHT_DTYPE)])
+
+    gpu_lap_times = CudaLapTimeEvaluator(left_limit, right_limit, car, 80.0).evaluate(weights)
+    cpu_lap_times = LapTimeCalculator(car).calculate_lap_times(weights, left_limit,
+                                                               right_limit.vertex_array - left_limit.vertex_array,
+                                                               starting_velocity=80.0)
+    assert np.all(np.isfinite(gpu_lap_times))
+    np.testing.assert_allclose(gpu_lap_times, cpu_lap_times, rtol=0.0, atol=3e-6)
@@ -0,0 +1,226 @@
+"""
+Tests for the evolutionary strategy.
+"""
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+from scipy.signal import savgol_filter
+
+from car import Car
+from evolutionary_strategy import SELECTION_EPSILON, WEIGHT_DTYPE, Candidate, EvolutionaryStrategy
+from helpers import SRC_DIR, make_track_limits
+from racing_line import RacingLine
+
+# Script running the strategy serially and then with a process pool in the same process. The serial run starts the
+# threads of the multi-threaded lap simulation kernel before the pool creates its worker processes.
+SERIAL_THEN_POOLED_SCRIPT = textwrap.dedent("""
+    import contextlib
+    import io
+
+    from car import Car
+    from evolutionary_strategy import EvolutionaryStrategy
+    from helpers import make_track_limits
+    from racing_line import RacingLine
+
+    if __name__ == "__main__":
+        left_vertices, right_vertices = make_track_limits()
+        left_limit, right_limit = RacingLine(left_vertices), RacingLine(right_vertices)
+        fitnesses = []
+        for num_workers in (None, 2):
+            strategy = EvolutionaryStrategy(left_limit, right_limit, Car(), starting_velocity=80.0, population_size=10,
+                                            num_offspring=10, iterations=2, num_workers=num_workers, seed=3)
+            with contextlib.redirect_stdout(io.StringIO()):
+                fitnesses.append(strategy.run().fitness)
+
+        print(*fitnesses)
+""")
+
+
+def test_serial_then_pooled_run_exits():
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR, tests_dir]))
+    result = subprocess.run([sys.executable, "-c", SERIAL_THEN_POOLED_SCRIPT], env=env, capture_output=True, text=True,
+                            timeout=300)
+
+    assert result.returncode == 0, result.stderr
+    serial_fitness, pooled_fitness = (float(value) for value in result.stdout.split())
+    assert serial_fitness > 0.0
+    assert pooled_fitness > 0.0
+
+
+def test_pool_is_detached_after_failed_run(monkeypatch):
+    left_vertices, right_vertices = make_track_limits()
+    strategy = EvolutionaryStrategy(RacingLine(left_vertices), RacingLine(right_vertices), Car(), population_size=4,
+                                    num_offspring=4, iterations=1, num_workers=2, seed=3)
+
+    def fail():
+        raise RuntimeError("Failed to generate the population.")
+
+    monkeypatch.setattr(strategy, "generate_population", fail)
+    with pytest.raises(RuntimeError):
+        strategy.run()
+
+    assert strategy._pool is None
+    lap_times = strategy.calculate_lap_times(np.full((2, strategy.candidate_length), 0.5))
+    assert np.all(np.asarray(lap_times) > 0.0)
+
+
+def select(fitnesses, population_size, seed):
+    """
+    Method to perform selection on a population of candidates with the given fitnesses.
+
+    Args:
+        fitnesses(list): Fitness of each candidate in the population.
+        population_size(int): Number of candidates to select.
+        seed(int): Seed of the random number generator of the strategy.
+
+    Returns:
+        counts(np.array): Number of times each candidate was selected.
+
+    """
+    left_vertices, right_vertices = make_track_limits()
+    strategy = EvolutionaryStrategy(RacingLine(left_vertices), RacingLine(right_vertices), Car(),
+                                    population_size=population_size, seed=seed)
+    # The weights of each candidate are filled with its index, so that the selected weights can be traced back.
+    strategy.population_weights = np.repeat(np.arange(len(fitnesses), dtype=WEIGHT_DTYPE)[:, np.newaxis],
+                                            strategy.candidate_length, axis=1)
+    strategy.population = [Candidate(weights) for weights in strategy.population_weights]
+    for candidate, fitness in zip(strategy.population, fitnesses):
+        candidate.lap_time = fitness
+
+    selected = strategy.perform_selection()
+    indices = [int(candidate.weights[0]) for candidate in selected]
+    assert len(selected) == population_size
+    np.testing.assert_array_equal(strategy.population_weights[:, 0], indices)
+    return np.bincount(indices, minlength=len(fitnesses))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_selection_places_evenly_spaced_pointers(seed):
+    fitnesses = np.random.default_rng(seed).uniform(80.0, 100.0, size=12)
+    counts = select(fitnesses, population_size=20, seed=seed)
+
+    # With evenly spaced pointers, each candidate is selected the number of times it is expected to be, rounded either
+    # way.
+    probabilities = fitnesses.max() - fitnesses + SELECTION_EPSILON
+    expected_counts = 20 * probabilities / probabilities.sum()
+    assert np.all(counts >= np.floor(expected_counts))
+    assert np.all(counts <= np.ceil(expected_counts))
+
+
+def test_selection_is_proportional_to_skewed_fitnesses():
+    # The candidates are 20, 15, 10 and 0 seconds faster than the slowest candidate.
+    counts = select([80.0, 85.0, 90.0, 100.0], population_size=9, seed=3)
+
+    np.testing.assert_array_equal(counts, [4, 3, 2, 0])
+
+
+def test_selection_of_equal_fitnesses_is_uniform():
+    # Without the selection offset, every candidate would have a selection weight of zero.
+    counts = select([90.0] * 4, population_size=8, seed=3)
+
+    np.testing.assert_array_equal(counts, [2, 2, 2, 2])
+
+
+@pytest.mark.parametrize("num_vertices, weight_group_size", [(200, 20), (205, 20), (37, 6)])
+def test_population_interpolates_group_centers(num_vertices, weight_group_size):
+    left_vertices, right_vertices = make_track_limits(num_vertices)
+    strategy = EvolutionaryStrategy(RacingLine(left_vertices), RacingLine(right_vertices), Car(),
+                                    weight_group_size=weight_group_size, smoothing_length=weight_group_size,
+                                    population_size=3, seed=3)
+    strategy.generate_population()
+
+    # The strategy draws one value per group from a generator with the same seed.
+    num_groups = len(range(0, num_vertices, weight_group_size))
+    group_weights = np.random.default_rng(3).random((3, num_groups), dtype=np.float32)
+    centers = (np.arange(num_groups) * weight_group_size) + (weight_group_size / 2)
+    for candidate_weights, candidate_group_weights in zip(strategy.population_weights, group_weights):
+        expected = np.interp(np.arange(num_vertices), centers, candidate_group_weights)
+        np.testing.assert_allclose(candidate_weights, expected, rtol=1e-6, atol=1e-6)
+
+
+def test_fitness_cache_evicts_least_recently_used_weights():
+    left_vertices, right_vertices = make_track_limits()
+    strategy = EvolutionaryStrategy(RacingLine(left_vertices), RacingLine(right_vertices), Car(), fitness_cache_size=2,
+                                    seed=3)
+    simulated = []
+    calculate_lap_time = strategy.lap_time_calculator.calculate_lap_time
+
+    def count_lap_time(line, **kwargs):
+        simulated.append(line)
+        return calculate_lap_time(line, **kwargs)
+
+    strategy.lap_time_calculator.calculate_lap_time = count_lap_time
+    first, second, third = (np.full(strategy.candidate_length, value, dtype=WEIGHT_DTYPE) for value in (0.2, 0.5, 0.8))
+
+    def get_fitness(weights):
+        return strategy.calculate_fitness(Candidate(weights))
+
+    first_fitness = get_fitness(first)
+    get_fitness(second)
+    # Weights that only differ past the decimals of the cache share the fitness of the first weights, which makes them
+    # the most recently used entry.
+    assert get_fitness(first + 1e-6) == first_fitness
+    # Caching the third weights evicts the second ones, which are now the least recently used.
+    get_fitness(third)
+    get_fitness(second)
+    get_fitness(third)
+
+    assert len(simulated) == 4
+    assert strategy.fitness_cache_hits == 2
+    assert strategy.fitness_cache_misses == 4
+    assert list(strategy._fitness_cache) == [strategy.get_fitness_cache_key(second),
+                                             strategy.get_fitness_cache_key(third)]
+
+
+def test_fitness_cache_counts_batch_lookups():
+    left_vertices, right_vertices = make_track_limits()
+    strategy = EvolutionaryStrategy(RacingLine(left_vertices), RacingLine(right_vertices), Car(), seed=3)
+    weights = np.full((3, strategy.candidate_length), 0.5, dtype=WEIGHT_DTYPE)
+    weights[1] = 0.3
+    strategy.population = [Candidate(candidate_weights) for candidate_weights in weights]
+    strategy.evaluate_population()
+
+    assert strategy.fitness_cache_hits == 0
+    assert strategy.fitness_cache_misses == 3
+    assert len(strategy._fitness_cache) == 2
+
+    strategy.population = [Candidate(candidate_weights) for candidate_weights in weights]
+    strategy.evaluate_population()
+
+    assert strategy.fitness_cache_hits == 3
+    assert strategy.fitness_cache_misses == 3
+    assert strategy.population[0].fitness == strategy.population[2].fitness
+
+
+@pytest.mark.parametrize("smoothing_length, smoothing_order", [(3, 1), (5, 2), (9, 1), (9, 3), (21, 2)])
+def test_smoothing_matches_savgol_filter(smoothing_length, smoothing_order):
+    left_vertices, right_vertices = make_track_limits()
+    strategy = EvolutionaryStrategy(RacingLine(left_vertices), RacingLine(right_vertices), Car(),
+                                    smoothing_length=smoothing_length, smoothing_order=smoothing_order, seed=3)
+    weights = np.random.default_rng(3).random((4, strategy.candidate_length), dtype=WEIGHT_DTYPE)
+
+    expected = savgol_filter(weights.astype(np.float64), smoothing_length, smoothing_order, axis=1, mode="interp")
+    np.testing.assert_allclose(strategy.smooth_weights(weights), expected, rtol=0.0, atol=1e-6)
+
+
+@pytest.mark.parametrize("smoothing_length", [21, 31])
+def test_population_smoothing_matches_savgol_filter(smoothing_length):
+    left_vertices, right_vertices = make_track_limits()
+    strategy = EvolutionaryStrategy(RacingLine(left_vertices), RacingLine(right_vertices), Car(), weight_group_size=20,
+                                    smoothing_length=smoothing_length, population_size=3, seed=3)
+    strategy.generate_population()
+
+    # The filter is applied to the interpolated weights when its window is longer than a weight group.
+    num_groups = len(range(0, strategy.candidate_length, 20))
+    group_weights = np.random.default_rng(3).random((3, num_groups), dtype=np.float32)
+    centers = (np.arange(num_groups) * 20) + 10
+    interpolated = np.array([np.interp(np.arange(strategy.candidate_length), centers, candidate_group_weights)
+                             for candidate_group_weights in group_weights])
+    expected = savgol_filter(interpolated, smoothing_length, strategy.smoothing_order, axis=1, mode="interp")
+    np.testing.assert_allclose(strategy.population_weights, expected, rtol=0.0, atol=1e-6)
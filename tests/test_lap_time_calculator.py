@@ -0,0 +1,74 @@
+"""
+Tests for the lap time calculator.
+"""
+
+import numpy as np
+import pytest
+
+from car import Car
+from helpers import make_track_limits
+from lap_time_calculator import LapTimeCalculator
+from racing_line import RacingLine, Sector
+
+
+def get_per_sector_lap_time(lap_time_calculator, vertices, car, starting_velocity):
+    """
+    Method to calculate a lap time the way it was calculated before the lap simulation kernel, with one pass over the
+    sector objects for acceleration, one reversed pass for braking and a sum of the sector times.
+
+    Args:
+        lap_time_calculator(LapTimeCalculator): Calculator providing the velocity of a car through a single sector.
+        vertices(np.array): Vertices of the racing line for the car to drive around, with one row per vertex.
+        car(Car): Car that will drive on the racing line.
+        starting_velocity(float): Velocity at which the car starts on the racing line in m/s.
+
+    Returns:
+        lap_time(float): Lap time taken by the car to drive around the racing line in seconds.
+
+    """
+    # The sector index wraps around at half the number of vertices, as in RacingLine.get_sector.
+    num_vertices = len(vertices)
+    start_indices = [2 * (idx % (num_vertices // 2)) for idx in range((num_vertices + 1) // 2)]
+    sectors = [Sector([vertices[start_idx], vertices[(start_idx + 1) % num_vertices],
+                       vertices[(start_idx + 2) % num_vertices]]) for start_idx in start_indices]
+    entry_velocity = starting_velocity
+    entry_velocities = []
+    exit_velocities = []
+    for sector in sectors:
+        exit_velocity = lap_time_calculator.get_sector_exit_velocity(sector, car, entry_velocity)
+        max_sector_velocity = lap_time_calculator.get_sector_max_velocity(sector, car)
+        entry_velocity = min(entry_velocity, max_sector_velocity)
+        exit_velocity = min(exit_velocity, max_sector_velocity)
+        entry_velocities.append(entry_velocity)
+        exit_velocities.append(exit_velocity)
+        entry_velocity = exit_velocity
+
+    last_sector_idx = 0
+    for current_sector_idx in reversed(range(len(sectors))):
+        if exit_velocities[current_sector_idx] > entry_velocities[last_sector_idx]:
+            max_entry_velocity = lap_time_calculator.get_sector_entry_velocity(
+                sectors[current_sector_idx], car, entry_velocities[last_sector_idx])
+            entry_velocities[current_sector_idx] = min(entry_velocities[current_sector_idx], max_entry_velocity)
+            exit_velocities[current_sector_idx] = entry_velocities[last_sector_idx]
+
+        last_sector_idx = current_sector_idx
+
+    return sum(2 * sector.length / (entry_velocity + exit_velocity)
+               for sector, entry_velocity, exit_velocity in zip(sectors, entry_velocities, exit_velocities))
+
+
+@pytest.mark.parametrize("num_vertices", [400, 401])
+@pytest.mark.parametrize("starting_velocity", [0.0, 80.0])
+def test_lap_time_matches_per_sector_sum(num_vertices, starting_velocity):
+    left_vertices, right_vertices = make_track_limits(num_vertices)
+    racing_line = RacingLine((0.3 * left_vertices) + (0.7 * right_vertices))
+    car = Car()
+    lap_time_calculator = LapTimeCalculator(car)
+
+    lap_time = lap_time_calculator.calculate_lap_time(racing_line, starting_velocity=starting_velocity)
+    # The sector objects are made from the single precision vertices stored by the racing line, so that only the lap
+    # simulation is compared. Rounding the vertices of this track to single precision changes its lap time by up to a
+    # few tenths of a millisecond on its own.
+    expected_lap_time = get_per_sector_lap_time(lap_time_calculator, racing_line.vertices.astype(np.float64), car,
+                                                starting_velocity)
+    assert lap_time == pytest.approx(expected_lap_time, abs=1e-9)
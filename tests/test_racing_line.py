@@ -0,0 +1,54 @@
+"""
+Tests for racing lines.
+"""
+
+import numpy as np
+import pytest
+
+import racing_line
+from helpers import make_track_limits
+from racing_line import VERTEX_DTYPE, RacingLine
+
+
+@pytest.mark.parametrize("num_vertices", [1, 2, 3, 200, 201])
+def test_simsimd_segment_lengths_match_numpy(monkeypatch, num_vertices):
+    pytest.importorskip("simsimd")
+    left_vertices, _ = make_track_limits(max(num_vertices, 3))
+    segments = RacingLine(left_vertices[:num_vertices]).segments
+
+    simsimd_lengths = racing_line.get_segment_lengths(segments)
+    monkeypatch.setattr(racing_line, "simsimd", None)
+    numpy_lengths = racing_line.get_segment_lengths(segments)
+
+    assert simsimd_lengths.dtype == numpy_lengths.dtype == VERTEX_DTYPE
+    assert simsimd_lengths.shape == numpy_lengths.shape == (num_vertices,)
+    np.testing.assert_allclose(simsimd_lengths, numpy_lengths, rtol=1e-6)
+
+
+@pytest.mark.parametrize("num_vertices", [2, 3, 200, 201])
+def test_sector_view_matches_get_sector(num_vertices):
+    left_vertices, _ = make_track_limits(max(num_vertices, 3))
+    line = RacingLine(left_vertices[:num_vertices])
+
+    for idx in range(num_vertices + 2):
+        np.testing.assert_array_equal(line.sector_view(idx), np.array(line.get_sector(idx).vertices))
+
+
+def test_sector_view_of_empty_line():
+    line = RacingLine()
+
+    assert line.sector_view(0).shape == (0, 3)
+    assert list(line.sectors) == []
+
+
+@pytest.mark.parametrize("idx", [0, 99])
+def test_sector_view_is_read_only(idx):
+    left_vertices, _ = make_track_limits()
+    line = RacingLine(left_vertices)
+    line_length = line.length
+
+    with pytest.raises(ValueError):
+        line.sector_view(idx)[0, 0] = 0.0
+
+    assert line.vertices.flags.writeable
+    assert line.length == line_length